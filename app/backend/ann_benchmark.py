@@ -0,0 +1,177 @@
+"""Benchmark of the ANN search parameters of a collection: recall@k against brute force, and latency
+
+Replays a query set against a collection for each search parameter setting and reports
+recall@k against an exact search computed locally, with the p50/p99 search latency.
+The latency of a primary key lookup is reported as a baseline: it is the network and
+server overhead of a request, without any vector search.
+
+Works against a Milvus server, or a local Milvus Lite file given as --uri (Milvus Lite
+only has a flat index, so all the settings return exact results there).
+
+Usage:
+    CONFIG_FILE=config.json python ann_benchmark.py <collection_name> [--queries queries.txt]
+        [--sample 100] [--k 4] [--settings '[{"ef": 32}, {"ef": 128}]'] [--uri ./milvus.db]
+
+Without --queries, vectors sampled from the collection are used as queries, and no
+embeddings endpoint is needed.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+from pymilvus import Collection, connections
+
+# Settings swept when none are given, by index type
+DEFAULT_SETTINGS = {
+    "HNSW": [{"ef": ef} for ef in (16, 32, 64, 128, 256)],
+    "IVF_FLAT": [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)],
+    "IVF_SQ8": [{"nprobe": nprobe} for nprobe in (1, 4, 16, 64)],
+    "DISKANN": [{"search_list": search_list} for search_list in (20, 50, 100, 200)],
+}
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+def vector_index(collection, field_name="vector"):
+    """Parameters of the index of the dense vector field, a hybrid collection also has sparse and scalar ones"""
+    for index in collection.indexes:
+        if index.field_name == field_name:
+            return index.params
+    return {}
+
+
+def load_vectors(collection, batch_size=1000):
+    """All the primary keys and vectors of a collection, for the exact search"""
+    pks, vectors = [], []
+    iterator = collection.query_iterator(batch_size=batch_size, expr="", output_fields=["pk", "vector"])
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            for row in rows:
+                pks.append(row["pk"])
+                vectors.append(row["vector"])
+    finally:
+        iterator.close()
+    return np.array(pks), np.array(vectors, dtype=np.float32)
+
+
+def exact_search(pks, vectors, query, k):
+    distances = ((vectors - np.asarray(query, dtype=np.float32)) ** 2).sum(axis=1)
+    top = np.argpartition(distances, min(k, len(distances) - 1))[:k]
+    return set(pks[top[np.argsort(distances[top])]].tolist())
+
+
+def embed_queries(path):
+    from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+
+    with open(os.getenv("CONFIG_FILE", "config.json"), "r") as file:
+        embeddings_config = json.load(file).get("embeddings")
+    embeddings = HuggingFaceInferenceAPIEmbeddings(
+        api_url=embeddings_config.get("inference_endpoint"),
+        api_key=embeddings_config.get("api_key"),
+        model_name=embeddings_config.get("model_name"),
+    )
+    with open(path, "r") as file:
+        queries = [line.strip() for line in file if line.strip()]
+    # Same prefix as the chatbot queries
+    return embeddings.embed_documents(["search_query: " + query for query in queries])
+
+
+def run_setting(collection, queries, k, params, metric_type):
+    timings, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = collection.search(
+            data=[query],
+            anns_field="vector",
+            param={"metric_type": metric_type, "params": params},
+            limit=k,
+            output_fields=["pk"],
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+        results.append({hit.id for hit in hits[0]})
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall@k and latency of a collection")
+    parser.add_argument("collection_name")
+    parser.add_argument("--uri", help="Milvus URI or Milvus Lite file, defaults to the vectorstore of the config")
+    parser.add_argument("--queries", help="File with one query per line, embedded with the configured model")
+    parser.add_argument("--sample", type=int, default=100, help="Number of stored vectors used as queries")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--settings", help="JSON list of search parameters to compare")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if args.uri:
+        connections.connect(uri=args.uri)
+    else:
+        with open(os.getenv("CONFIG_FILE", "config.json"), "r") as file:
+            vectorstore = json.load(file).get("vectorstore", {})
+        connections.connect(
+            uri=vectorstore.get("uri", "http://localhost:19530"),
+            user=vectorstore.get("user", ""),
+            password=vectorstore.get("password", ""),
+            db_name=vectorstore.get("db_name", "default"),
+        )
+    collection = Collection(args.collection_name)
+    collection.load()
+
+    index = vector_index(collection)
+    index_type = index.get("index_type", "FLAT")
+    metric_type = index.get("metric_type", "L2")
+    if metric_type != "L2":
+        raise SystemExit(f"Exact search is only implemented for L2, the collection uses {metric_type}")
+
+    pks, vectors = load_vectors(collection)
+    if args.queries:
+        queries = embed_queries(args.queries)
+    else:
+        rng = random.Random(args.seed)
+        queries = [vectors[i].tolist() for i in rng.sample(range(len(vectors)), min(args.sample, len(vectors)))]
+    truth = [exact_search(pks, vectors, query, args.k) for query in queries]
+
+    if args.settings:
+        settings = json.loads(args.settings)
+    else:
+        settings = DEFAULT_SETTINGS.get(index_type, [{}])
+
+    # Baseline: a primary key lookup has the same network path, without any vector search
+    baseline = []
+    for pk in pks[: len(queries)].tolist():
+        start = time.perf_counter()
+        collection.query(expr=f"pk in [{pk}]", output_fields=["pk"])
+        baseline.append((time.perf_counter() - start) * 1000)
+
+    print(
+        f"{args.collection_name}: {len(vectors)} vectors, index {index_type} {index.get('params', {})}, "
+        f"{len(queries)} queries, k={args.k}"
+    )
+    print(f"{'setting':<32} {'recall@k':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    print(
+        f"{'pk lookup (baseline)':<32} {'':>9} "
+        f"{statistics.median(baseline):9.2f} {percentile(baseline, 0.99):9.2f}"
+    )
+    for params in settings:
+        timings, results = run_setting(collection, queries, args.k, params, metric_type)
+        recall = statistics.mean(
+            len(found & expected) / max(len(expected), 1) for found, expected in zip(results, truth)
+        )
+        print(
+            f"{json.dumps(params):<32} {recall:9.3f} "
+            f"{statistics.median(timings):9.2f} {percentile(timings, 0.99):9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
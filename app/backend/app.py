@@ -17,6 +17,7 @@ from starlette.exceptions import HTTPException as StarletteHTTPException
 import chatbot
 import collections_loader as cl
 from helpers import logging_config
+from query_scheduler import QueryScheduler
 
 # Load local env vars if present
 load_dotenv()
@@ -60,7 +61,12 @@ _logger.info(
 )
 
 # Initialize Chatbot
-chatbot = chatbot.Chatbot(config, _logger)
+chatbot = chatbot.Chatbot(
+    config,
+    _logger,
+    collection_routes=collections_loader.collection_routes,
+    collection_search_params=collections_loader.search_params,
+)
 
 # App creation
 app = FastAPI()
@@ -100,6 +106,18 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+
+@app.on_event("startup")
+async def startup():
+    """Bound the default executor used by sync-only components"""
+    asyncio.get_running_loop().set_default_executor(chatbot.executor)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the shared clients"""
+    await chatbot.aclose()
+
 #############################
 # API Endpoints definitions #
 #############################
@@ -125,30 +143,60 @@ async def get_collections():
     return collections
 
 
-async def handle_client_request(websocket: WebSocket, data: dict):
-    async for next_item in chatbot.stream(
-        data["model"],
-        data["query"],
-        data["collection"],
-        data["collection_full_name"],
-        data["version"],
-        data["language"],
-    ):
-        answer = json.dumps(next_item)
-        await websocket.send_text(answer)
+# Response cache metrics
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Get response cache hit/miss metrics"""
+    if chatbot.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chatbot.response_cache.stats()}
+
+
+# Embeddings cache metrics
+@app.get("/api/cache/embeddings/stats")
+async def get_embeddings_cache_stats():
+    """Get embeddings cache hit/miss metrics"""
+    if not hasattr(chatbot.embeddings, "stats"):
+        return {"enabled": False}
+    return {"enabled": True, **chatbot.embeddings.stats()}
+
+
+# Translation cache metrics
+@app.get("/api/cache/translations/stats")
+async def get_translation_cache_stats():
+    """Get translation cache hit/miss metrics"""
+    return chatbot.translator.stats()
 
 
 @app.websocket("/ws/query/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: int):
     await manager.connect(websocket)
+    scheduler = QueryScheduler(
+        websocket,
+        chatbot,
+        _logger,
+        max_inflight=int(config.get("MAX_INFLIGHT_QUERIES_PER_CLIENT", 4)),
+        send_queue_size=int(config.get("SEND_QUEUE_SIZE", 64)),
+    )
+    scheduler.start()
     try:
         while True:
             data = await websocket.receive_text()
-            data = json.loads(data)
-            asyncio.create_task(handle_client_request(websocket, data))
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError:
+                _logger.warning(f"Client {client_id} sent an invalid message")
+                continue
+            if data.get("type") == "cancel":
+                await scheduler.cancel(data.get("request_id"))
+            else:
+                await scheduler.submit(data)
     except WebSocketDisconnect:
         manager.disconnect(websocket)
         _logger.info(f"Client {client_id} disconnected")
+    finally:
+        # Stop everything this client started
+        await scheduler.close()
 
 
 # Serve React App (frontend)
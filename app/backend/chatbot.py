@@ -1,38 +1,30 @@
+import contextlib
 import os
+import time
 from collections.abc import Generator
 from queue import Empty, Queue
 from threading import Thread
 
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain.chains import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.prompts import PromptTemplate
-from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
 from langchain_community.llms import VLLMOpenAI
 
-from milvus_retriever_with_score_threshold import \
-    MilvusRetrieverWithScoreThreshold
+from context_builder import build_context
+from embeddings import AsyncInferenceAPIEmbeddings, CachedEmbeddings
+from federated_retriever import FederatedRetriever
+from llm_clients import LLMClientPool
+from milvus_retriever_with_score_threshold import (
+    MilvusRetrieverWithScoreThreshold, build_filter_expression)
+from milvus_store_pool import MilvusStorePool
+from reranker import CrossEncoderReranker
+from response_cache import SemanticResponseCache
+from translation import QueryTranslator
 
 import asyncio
-from asyncio import Queue as AsyncQueue, QueueEmpty
+from asyncio import Queue as AsyncQueue
 from concurrent.futures import ThreadPoolExecutor
 
 
-class QueueCallback(BaseCallbackHandler):
-    """Callback handler for streaming LLM responses to an async queue."""
-
-    def __init__(self, q: AsyncQueue, logger):
-        self.q = q
-        self.logger = logger
-
-    async def on_llm_new_token(self, token: str, **kwargs) -> None:
-        data = {"type": "token", "token": token}
-        await self.q.put(data)
-
-    async def on_llm_end(self, *args, **kwargs) -> None:
-        await self.q.put(None)  # Signal the end of the stream
-
-
 class Chatbot:
     """
     A class representing a chatbot.
@@ -40,6 +32,10 @@ class Chatbot:
     Args:
         config (dict): Configuration settings for the chatbot.
         logger: Logger object for logging messages.
+        collection_routes (dict): Per-version collection names stored in a partitioned
+            collection, mapped to (partitioned collection name, version).
+        collection_search_params (dict): Search parameters of the vector index of each
+            Milvus collection, the store defaults are used for the others.
 
     Attributes:
         logger: Logger object for logging messages.
@@ -53,16 +49,20 @@ class Chatbot:
         stream: Streams the chatbot's response based on the query and other parameters.
     """
 
-    def __init__(self, config, logger):
+    def __init__(self, config, logger, collection_routes=None, collection_search_params=None):
         os.environ["TOKENIZERS_PARALLELISM"] = "false"
         self.logger = logger
         self.config = config
+        self.collection_routes = collection_routes or {}
+        self.collection_search_params = collection_search_params or {}
         self.model_kwargs = {"trust_remote_code": True}
         self.llms_config = self.config.get('llms', [])
 
-        # Instantiate LLMs
+        # Instantiate LLMs, sharing one pooled HTTP client per inference endpoint
+        self.llm_clients = LLMClientPool(self.logger)
         self.llm_instances = {}
         for llm in self.llms_config:
+            client, async_client = self.llm_clients.get_clients(llm)
             self.llm_instances[llm.get('name')] = VLLMOpenAI(
                 openai_api_key=llm.get('api_key'),
                 openai_api_base=llm.get('inference_endpoint'),
@@ -72,21 +72,88 @@ class Chatbot:
                 temperature=llm.get('temperature'),
                 presence_penalty=llm.get('presence_penalty'),
                 streaming=True,
-                verbose=False
+                verbose=False,
+                client=client,
+                async_client=async_client,
             )
 
-        # Instantiate Embeddings
-        self.embeddings = HuggingFaceInferenceAPIEmbeddings(
-            api_url=self.config.get('embeddings').get('inference_endpoint'),
-            api_key=self.config.get('embeddings').get('api_key'),
-            model_name=self.config.get('embeddings').get('model_name'),
+        # Instantiate Embeddings, behind a cache unless disabled
+        embeddings_config = self.config.get('embeddings')
+        self.embeddings = AsyncInferenceAPIEmbeddings(
+            api_url=embeddings_config.get('inference_endpoint'),
+            api_key=embeddings_config.get('api_key'),
+            model_name=embeddings_config.get('model_name'),
+            max_connections=int(embeddings_config.get('max_connections', 100)),
         )
+        if int(embeddings_config.get('cache_size', 10000)) > 0:
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                model_name=embeddings_config.get('name', embeddings_config.get('model_name')),
+                max_size=int(embeddings_config.get('cache_size', 10000)),
+                cache_file=embeddings_config.get('cache_file'),
+                logger=self.logger,
+            )
 
         # Instantiate Vector Store
         self.vectorstore = self.config.get('vectorstore', {})
 
-        # Instantiate Executor    
-        self.executor = ThreadPoolExecutor()
+        # Instantiate the pool of Milvus stores shared by all queries
+        self.store_pool = MilvusStorePool(
+            embedding_function=self.embeddings,
+            connection_args={
+                "uri": self.vectorstore.get("uri", "http://localhost:19530"),
+                "user": self.vectorstore.get("user", ""),
+                "password": self.vectorstore.get("password", ""),
+                "db_name": self.vectorstore.get("db_name", "default"),
+            },
+            logger=self.logger,
+            max_size=int(self.vectorstore.get("pool_size", 32)),
+            health_check_interval=float(self.vectorstore.get("health_check_interval", 30)),
+            consistency_level=self.vectorstore.get("consistency_level", "Session"),
+        )
+
+        # Instantiate the answers cache, if enabled
+        cache_config = self.config.get('response_cache') or {}
+        self.response_cache = None
+        if cache_config.get('enabled', False):
+            self.response_cache = SemanticResponseCache(
+                self.logger,
+                similarity_threshold=float(cache_config.get('similarity_threshold', 0.95)),
+                ttl_seconds=float(cache_config.get('ttl_seconds', 3600)),
+                max_entries=int(cache_config.get('max_entries', 1000)),
+                max_bytes=int(cache_config.get('max_bytes', 64 * 1024 * 1024)),
+            )
+
+        # Instantiate the query translator
+        self.translator = QueryTranslator(
+            self.logger, max_size=int(self.config.get("TRANSLATION_CACHE_SIZE", 1000))
+        )
+
+        # Instantiate Executor, only used as a fallback for sync-only components
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(self.config.get("EXECUTOR_MAX_WORKERS", 8)),
+            thread_name_prefix="chatbot-sync",
+        )
+
+        # Instantiate the reranker, if enabled
+        reranker_config = self.config.get('reranker') or {}
+        self.reranker = None
+        if reranker_config.get('enabled', False):
+            self.reranker = CrossEncoderReranker(
+                reranker_config.get('model_name', 'cross-encoder/ms-marco-MiniLM-L-6-v2'),
+                self.logger,
+                top_n=int(self.config.get("MAX_RETRIEVED_DOCS", 4)),
+                budget_ms=float(reranker_config.get('budget_ms', 300)),
+                max_length=int(reranker_config.get('max_length', 512)),
+            )
+
+    async def aclose(self):
+        """Closes the shared HTTP clients and the executor."""
+        await self.llm_clients.aclose()
+        await self.embeddings.aclose()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.reranker is not None:
+            self.reranker.close()
 
     def _format_sources(self, sources_list):
         """
@@ -104,7 +171,67 @@ class Chatbot:
                 unique_list.append([item.metadata['source'], item.metadata['score']])
         return unique_list
 
-    async def stream(self, model, query, collection, collection_full_name, version, language):
+    def _retrieval_k(self):
+        """Number of documents to retrieve, more candidates are fetched when reranking."""
+        if self.reranker is not None and self.reranker.enabled:
+            return int(self.config.get("reranker").get("candidates", 20))
+        return int(self.config.get("MAX_RETRIEVED_DOCS", 4))
+
+    def _route(self, collection, expr=None):
+        """
+        Resolves a per-version collection name to the Milvus collection storing it.
+
+        Args:
+            collection (str): The per-version collection name.
+            expr (str): Optional filter expression on the chunk metadata.
+
+        Returns:
+            tuple: The Milvus collection name and the filter expression, restricted to
+                the version if the collection is partitioned.
+        """
+        if collection not in self.collection_routes:
+            return collection, expr
+        base_name, version = self.collection_routes[collection]
+        version_expr = build_filter_expression({"version": version})
+        return base_name, f"({version_expr}) and ({expr})" if expr else version_expr
+
+    async def _get_retriever(self, collection, expr=None, sparse_query=None):
+        """
+        Creates a retriever on the pooled store of a collection.
+
+        Args:
+            collection (str): The name of the Milvus collection.
+            expr (str): Optional filter expression on the chunk metadata.
+            sparse_query (str): Optional query of the sparse search in hybrid mode.
+
+        Returns:
+            MilvusRetrieverWithScoreThreshold: The retriever.
+        """
+        collection, expr = self._route(collection, expr)
+        return MilvusRetrieverWithScoreThreshold(
+            embedding_function=self.embeddings,
+            collection_name=collection,
+            store=await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.store_pool.get, collection
+            ),
+            search_params=self.collection_search_params.get(collection),
+            expr=expr,
+            k=self._retrieval_k(),
+            score_threshold=float(self.config.get("SCORE_THRESHOLD", 0.99)),
+            enable_dynamic_field=True,
+            text_field="page_content",
+            logger=self.logger,
+            executor=self.executor,
+            search_mode=self.vectorstore.get("search_mode", "dense"),
+            fusion=self.vectorstore.get("fusion", "rrf"),
+            dense_weight=float(self.vectorstore.get("dense_weight", 0.7)),
+            sparse_weight=float(self.vectorstore.get("sparse_weight", 0.3)),
+            rrf_k=int(self.vectorstore.get("rrf_k", 60)),
+            hybrid_candidates=int(self.vectorstore.get("hybrid_candidates", 20)),
+            sparse_query=sparse_query,
+        )
+
+    async def stream(self, model, query, collection, collection_full_name, version, language, collections=None, filters=None):
         """
         Streams the chatbot's response based on the query and other parameters.
 
@@ -113,72 +240,50 @@ class Chatbot:
             collection (str): The name of the collection.
             collection_full_name (str): The full name of the product.
             version (str): The version of the product.
+            collections (list): Optional list of {"collection", "collection_full_name", "version"}
+                to search together, in which case collection, collection_full_name and version are ignored.
+            filters (dict): Optional "language", "title" and "header_prefix" filters on the documents.
 
         Yields:
-            dict: The chatbot's response data.
+            dict: The chatbot's response data: "source" frames first, then "token" frames,
+                then a "timing" frame, or an "error" frame.
         """
-        # A Queue is needed for Streaming implementation
-        q = AsyncQueue()
+        # A bounded Queue is needed for Streaming implementation, it also applies backpressure
+        q = AsyncQueue(maxsize=int(self.config.get("STREAM_QUEUE_SIZE", 64)))
         job_done = object()
 
-        selected_llm = next((item for item in self.llms_config if item["name"] == model), None)
-        if selected_llm:
-            llm = VLLMOpenAI(
-                openai_api_key=selected_llm.get('api_key'),
-                openai_api_base=selected_llm.get('inference_endpoint'),
-                model_name=selected_llm.get('model_name'),
-                max_tokens=selected_llm.get('max_tokens'),
-                top_p=selected_llm.get('top_p'),
-                temperature=selected_llm.get('temperature'),
-                presence_penalty=selected_llm.get('presence_penalty'),
-                streaming=True,
-                verbose=False,
-                callbacks=[QueueCallback(q, self.logger)]
-            )
-        else:
+        llm = self.llm_instances.get(model)
+        if llm is None:
+            yield {"type": "error", "error": f"Unknown model: {model}"}
             return
-        
         translation_model = model
-        selected_translation_llm = next((item for item in self.llms_config if item["name"] == translation_model), None)
-        if selected_translation_llm:
-            llm_translate = VLLMOpenAI(
-                openai_api_key=selected_translation_llm.get('api_key'),
-                openai_api_base=selected_translation_llm.get('inference_endpoint'),
-                model_name=selected_translation_llm.get('model_name'),
-                max_tokens=selected_translation_llm.get('max_tokens'),
-                top_p=selected_translation_llm.get('top_p'),
-                temperature=selected_translation_llm.get('temperature'),
-                presence_penalty=selected_translation_llm.get('presence_penalty'),
-                streaming=False,
-                verbose=False
-            )
-        else:
-            return
+        llm_translate = self.llm_instances.get(translation_model)
 
         self.logger.info(f"Collection: {collection}")
         self.logger.info(f"Collection Full Name: {collection_full_name}")
         self.logger.info(f"Version: {version}")
         self.logger.info(f"Language: {language}")
-        
-        retriever = MilvusRetrieverWithScoreThreshold(
-            embedding_function=self.embeddings,
-            collection_name=collection,
-            collection_description="",
-            collection_properties=None,
-            connection_args={
-                "uri": self.vectorstore.get("uri", "http://localhost:19530"),
-                "user": self.vectorstore.get("user", ""),
-                "password": self.vectorstore.get("password", ""),
-                "db_name": self.vectorstore.get("db_name", "default"),
-            },
-            consistency_level="Session",
-            search_params=None,
-            k=int(self.config.get("MAX_RETRIEVED_DOCS", 4)),
-            score_threshold=float(self.config.get("SCORE_THRESHOLD", 0.99)),
-            enable_dynamic_field=True,
-            text_field="page_content",
-            logger=self.logger,
-        )
+
+        # Replay the answer of the same or a similar previous query if there is one
+        expr = build_filter_expression(filters)
+        if collections:
+            cache_key = (model, tuple(item["collection"] for item in collections), None, language, expr)
+        else:
+            cache_key = (model, collection, version, language, expr)
+        query_embedding = None
+        if self.response_cache is not None:
+            cached_frames = self.response_cache.lookup_text(cache_key, query)
+            if cached_frames is None:
+                try:
+                    query_embedding = await self.embeddings.aembed_query('search_query: ' + query)
+                    cached_frames = self.response_cache.lookup(cache_key, query_embedding)
+                except Exception as e:
+                    self.logger.warning(f"Response cache lookup failed: {e}")
+            if cached_frames is not None:
+                self.logger.info("Response cache hit")
+                for frame in cached_frames:
+                    yield frame
+                return
 
         language_mapping = {
             "en": "English",
@@ -195,51 +300,149 @@ class Chatbot:
 
         translate_prompt = next((item["translate_prompt"] for item in self.llms_config if item["name"] == translation_model), None)
 
-        # Instantiate RAG chain
-        combine_docs_chain = create_stuff_documents_chain(llm, prompt)
-        rag_chain = create_retrieval_chain(retriever, combine_docs_chain)
+        # Create a function to call - this runs as a task on the event loop
+        async def produce():
+            def search_query(english_query):
+                if collections:
+                    full_names = list(dict.fromkeys(item["collection_full_name"] for item in collections))
+                    return f"We are talking about {', '.join(full_names)}. {english_query}"
+                if (collection_full_name != "None") and (version != "None"):
+                    return f"We are talking about {collection_full_name}. {english_query}"
+                return english_query
+
+            timings = {"translation_ms": 0.0, "retrieval_ms": 0.0, "rerank_ms": 0.0, "generation_ms": 0.0}
 
-        # Create a function to call - this will run in a thread
-        async def task():
-            loop = asyncio.get_event_loop()
             # Translate the query to English if needed
+            start = time.perf_counter()
             if language != "en":
-                english_query = await loop.run_in_executor(
-                    self.executor,
-                    llm_translate.invoke,
-                    translate_prompt.format(input=query)
-                )
-                english_query = str(english_query).replace("English:", "").replace("Answer:", "").replace("English translation:", "").replace("Translation:", "").strip().lstrip('\t')
+                speculative_embedding = None
+                if isinstance(self.embeddings, CachedEmbeddings):
+                    # The embedding of the untranslated query is computed at the same time, it is
+                    # reused through the embeddings cache if the translation doesn't change the query
+                    speculative_embedding = asyncio.create_task(
+                        self.embeddings.aembed_query('search_query: ' + search_query(query))
+                    )
+                    speculative_embedding.add_done_callback(
+                        lambda task: task.cancelled() or task.exception()
+                    )
+                try:
+                    english_query = await self.translator.translate(
+                        llm_translate, translate_prompt, translation_model, language, query
+                    )
+                except BaseException:
+                    if speculative_embedding is not None:
+                        speculative_embedding.cancel()
+                    raise
+                if speculative_embedding is not None and english_query.split() != query.split():
+                    speculative_embedding.cancel()
             else:
                 english_query = query
+            timings["translation_ms"] = (time.perf_counter() - start) * 1000
 
-            if (collection_full_name != "None") and (version != "None"):
-                new_query = f"We are talking about {collection_full_name}. {english_query}"
-            else:
-                new_query = english_query
+            new_query = search_query(english_query)
             self.logger.info(f"New Query: {new_query}")
-            resp = await loop.run_in_executor(
-                self.executor,
-                rag_chain.invoke,
-                {"input": 'search_query: ' + new_query}
+
+            if collections:
+                retriever = FederatedRetriever(
+                    retrievers=await asyncio.gather(
+                        *[self._get_retriever(item["collection"], expr, english_query) for item in collections]
+                    ),
+                    k=self._retrieval_k(),
+                    score_threshold=float(self.config.get("SCORE_THRESHOLD", 0.99)),
+                    deadline=float(self.config.get("FEDERATED_RETRIEVAL_DEADLINE", 5)),
+                    logger=self.logger,
+                )
+            else:
+                retriever = await self._get_retriever(collection, expr, english_query)
+
+            # Retrieve first, so the sources are sent before the answer starts
+            start = time.perf_counter()
+            try:
+                context = await retriever.ainvoke('search_query: ' + new_query)
+            except Exception:
+                # Force a reconnect on next query in case the pooled stores are broken
+                for item in collections or [{"collection": collection}]:
+                    self.store_pool.invalidate(self._route(item["collection"])[0])
+                raise
+            timings["retrieval_ms"] = (time.perf_counter() - start) * 1000
+            if self.reranker is not None:
+                start = time.perf_counter()
+                context = await self.reranker.arerank(new_query, context)
+                timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+            sources = self._format_sources(context)
+            for source in sources:
+                data = {"type": "source", "source": source[0], "score": source[1]}
+                await q.put(data)
+
+            # Merge overlapping chunks and fit them in the context budget of the model
+            selected_llm = next((item for item in self.llms_config if item["name"] == model), {})
+            context = build_context(
+                context,
+                max_tokens=selected_llm.get("context_tokens"),
+                chars_per_token=float(self.config.get("CONTEXT_CHARS_PER_TOKEN", 4)),
             )
-            sources = self._format_sources(resp['context'])
-            if len(sources) != 0:
-                for source in sources:
-                    data = {"type": "source", "source": source[0], "score": source[1]}
-                    await q.put(data)
-            await q.put(job_done)
 
-        # Run the task in the background
-        asyncio.create_task(task())
+            # Stream the answer, tokens are forwarded as soon as the LLM sends them
+            start = time.perf_counter()
+            combine_docs_chain = create_stuff_documents_chain(llm, prompt)
+            async for token in combine_docs_chain.astream(
+                {"input": 'search_query: ' + new_query, "context": context}
+            ):
+                if token:
+                    await q.put({"type": "token", "token": token})
+            timings["generation_ms"] = (time.perf_counter() - start) * 1000
 
-        # Get each new item from the queue and yield for our generator
-        while True:
+            await q.put({"type": "timing", **{name: round(value, 1) for name, value in timings.items()}})
+
+        async def task():
             try:
-                next_item = await asyncio.wait_for(q.get(), timeout=1.0)
+                await produce()
+            except Exception as e:
+                self.logger.exception(f"Error while answering query: {e}")
+                await q.put({"type": "error", "error": str(e)})
+            # Signal the end of the stream right away, unless the consumer cancelled us
+            await q.put(job_done)
+
+        async def next_frame():
+            """Next frame of the producer, or job_done once it ended, even without posting it"""
+            if not q.empty():
+                return q.get_nowait()
+            if not producer.done():
+                getter = asyncio.ensure_future(q.get())
+                try:
+                    await asyncio.wait((getter, producer), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    getter.cancel()
+                if getter.done() and not getter.cancelled():
+                    return getter.result()
+            # A producer cancelled from elsewhere never posts job_done
+            return q.get_nowait() if not q.empty() else job_done
+
+        # Run the task in the background, its lifetime is tied to this generator
+        producer = asyncio.create_task(task())
+        frames = []
+        try:
+            while True:
+                next_item = await next_frame()
                 if next_item is job_done:
                     break
-                if isinstance(next_item, dict):
-                    yield next_item
-            except (QueueEmpty, asyncio.TimeoutError):
-                continue
+                frames.append(next_item)
+                yield next_item
+            # Only complete, successful answers are cached
+            if (
+                query_embedding is not None
+                and any(frame["type"] == "token" for frame in frames)
+                and not any(frame["type"] == "error" for frame in frames)
+            ):
+                self.response_cache.store(
+                    cache_key,
+                    query,
+                    query_embedding,
+                    [frame for frame in frames if frame["type"] in ("source", "token")],
+                )
+        finally:
+            # The consumer is gone or done: cancel the producer, which closes the upstream LLM request
+            if not producer.done():
+                producer.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await producer
@@ -19,11 +19,13 @@ class VersionInfo:
 
 
 class Collection:
-    def __init__(self, collection_base_name, collection_full_name, versions, common_sources=None):
+    def __init__(self, collection_base_name, collection_full_name, versions, common_sources=None, index=None):
         self.collection_base_name: str = collection_base_name
         self.collection_full_name: str = collection_full_name
         self.versions: list[VersionInfo] = versions
         self.common_sources: list[Source] | None = common_sources
+        # ANN index type, build "params" and "search_params" of the vector field
+        self.index: dict | None = index
 
     def __repr__(self):
-        return f"ProductInfo(collection_base_name={self.collection_base_name}, collection_full_name={self.collection_full_name}, versions={self.versions}, common_sources={self.common_sources})"
\ No newline at end of file
+        return f"ProductInfo(collection_base_name={self.collection_base_name}, collection_full_name={self.collection_full_name}, versions={self.versions}, common_sources={self.common_sources}, index={self.index})"
\ No newline at end of file
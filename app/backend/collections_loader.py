@@ -17,6 +17,12 @@ class CollectionsLoader:
         self.collections_git_repo_path = collection_config.get("git_repo_path")
         self.collections_git_repo_branch = collection_config.get("git_repo_branch")
         self.vectorstore_config = vectorstore_config
+        # Per-version collection name -> (partitioned collection name, version)
+        self.collection_routes = {}
+        # Milvus collection name -> search parameters of its vector index
+        self.search_params = {}
+        # Alias -> collection it currently points to, e.g. the generation of a blue/green ingestion
+        self.collection_aliases = {}
         self._logger = logger
     
     def _load_collection_from_json(self, data: str) -> Collection:
@@ -49,7 +55,8 @@ class CollectionsLoader:
             collection_base_name=data.get("collection_base_name"),
             collection_full_name=data.get("collection_full_name"),
             versions=versions,
-            common_sources=common_sources
+            common_sources=common_sources,
+            index=data.get("index")
         )
 
         return collection
@@ -91,6 +98,44 @@ class CollectionsLoader:
             # Return a tuple with lower priority flag and original string
             return (False, version_obj.version_number)
     
+    def _search_params(self, collection):
+        """Search parameters of a collection: vectorstore defaults for its index type, then its own"""
+        index = collection.index or {}
+        index_type = index.get("index_type", "AUTOINDEX").upper()
+        defaults = self.vectorstore_config.get("search_params", {}).get(index_type, {})
+        return {"metric_type": "L2", "params": {**defaults, **index.get("search_params", {})}}
+
+    def _partition_exists(self, milvus_client, milvus_collections, collection, version):
+        """Check if a version is stored in the partitioned collection of a product"""
+        base_name = collection.collection_base_name.replace("-", "_").replace(".", "_")
+        if base_name not in milvus_collections:
+            return False
+        version_number = version.version_number.replace('\\', '\\\\').replace('"', '\\"')
+        try:
+            rows = milvus_client.query(
+                base_name, filter=f'version == "{version_number}"', output_fields=["pk"], limit=1
+            )
+        except Exception as e:
+            self._logger.warning(f"Could not query versions of {base_name}: {e}")
+            return False
+        return len(rows) > 0
+
+    def _list_aliases(self, milvus_client):
+        """Aliases of the database and their collections, searches on an alias follow its swaps"""
+        try:
+            aliases = milvus_client.list_aliases()["aliases"]
+        except Exception as e:
+            # Milvus Lite has no aliases
+            self._logger.warning(f"Could not list Milvus aliases: {e}")
+            return {}
+        targets = {}
+        for alias in aliases:
+            try:
+                targets[alias] = milvus_client.describe_alias(alias)["collection_name"]
+            except Exception as e:
+                self._logger.warning(f"Could not describe Milvus alias {alias}: {e}")
+        return targets
+
     def _filter_collections(self):
         """Filter collections based on them being available in Milvus"""
         milvus_uri = self.vectorstore_config.get('uri', 'localhost')
@@ -107,6 +152,11 @@ class CollectionsLoader:
 
         # Load collections from Milvus
         milvus_collections = milvus_client.list_collections()
+        self.collection_aliases = self._list_aliases(milvus_client)
+        for alias, target in self.collection_aliases.items():
+            self._logger.info(f"Milvus alias {alias} points to {target}")
+        # Collections are searched through their alias when they have one
+        milvus_collections = set(milvus_collections) | set(self.collection_aliases)
 
         # Filter collections
         new_collections = []
@@ -121,6 +171,13 @@ class CollectionsLoader:
                 # Replace needed because Milvus collection names cannot contain hyphens or periods
 
                 if milvus_collection_name in milvus_collections:
+                    self.search_params[milvus_collection_name] = self._search_params(collection)
+                    new_versions.append(version)
+                elif self._partition_exists(milvus_client, milvus_collections, collection, version):
+                    # Versions consolidated in one collection, partitioned by version
+                    base_name = collection.collection_base_name.replace("-", "_").replace(".", "_")
+                    self.collection_routes[milvus_collection_name] = (base_name, version.version_number)
+                    self.search_params[base_name] = self._search_params(collection)
                     new_versions.append(version)
             if len(new_versions) > 0:
                 # Sort versions in descending order using semantic versioning
@@ -0,0 +1,112 @@
+"""Assembly of the retrieved chunks into the context given to the LLM"""
+import re
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+# Header added to every chunk at ingestion to guide the embeddings model
+_CHUNK_HEADER = re.compile(r"^search_document: Section: (?P<section>.*?)\n\nContent:\n", re.DOTALL)
+
+
+def split_chunk(text):
+    """
+    Separates the section path from the content of a chunk.
+
+    Args:
+        text (str): The chunk, as stored in Milvus.
+
+    Returns:
+        tuple: The section path (or None) and the content.
+    """
+    match = _CHUNK_HEADER.match(text)
+    if match is None:
+        return None, text
+    return match.group("section"), text[match.end():]
+
+
+def merge_overlapping(first, second, min_overlap=16, max_overlap=1024):
+    """
+    Merges two chunks if the end of the first one is the start of the second one.
+
+    Args:
+        first (str): The first chunk.
+        second (str): The second chunk.
+        min_overlap (int): Minimum overlap, in characters, to consider the chunks adjacent.
+        max_overlap (int): Maximum overlap searched, in characters.
+
+    Returns:
+        str | None: The merged text, or None if the chunks don't overlap.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for size in range(min(len(first), len(second), max_overlap), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def _merge_pieces(pieces):
+    """Merges all the overlapping pieces of a section, in any order."""
+    merged = True
+    while merged and len(pieces) > 1:
+        merged = False
+        for i in range(len(pieces)):
+            for j in range(len(pieces)):
+                if i == j:
+                    continue
+                result = merge_overlapping(pieces[i], pieces[j])
+                if result is not None:
+                    pieces[i] = result
+                    del pieces[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return pieces
+
+
+def build_context(
+    docs: List[Document],
+    max_tokens: Optional[int] = None,
+    chars_per_token: float = 4.0,
+) -> List[Document]:
+    """
+    Builds the context documents from the retrieved chunks.
+
+    Chunks from the same source and section path are grouped, overlapping chunks
+    are merged, the embedding prefix is removed, and the groups are packed in
+    retrieval order until the token budget is reached.
+
+    Args:
+        docs (list): The retrieved chunks, best first.
+        max_tokens (int): Token budget of the context, None for no limit.
+        chars_per_token (float): Average number of characters per token, to estimate sizes.
+
+    Returns:
+        list: The context documents, best first.
+    """
+    groups = {}
+    for doc in docs:
+        section, content = split_chunk(doc.page_content)
+        key = (doc.metadata.get("source"), section)
+        if key not in groups:
+            groups[key] = {"metadata": doc.metadata, "section": section, "pieces": []}
+        groups[key]["pieces"].append(content.strip())
+
+    context = []
+    budget = max_tokens * chars_per_token if max_tokens else None
+    for group in groups.values():
+        text = "\n\n".join(_merge_pieces(group["pieces"]))
+        if group["section"]:
+            text = f"Section: {group['section']}\n\n{text}"
+        if budget is not None:
+            if len(text) > budget:
+                # Truncate the last group, unless only a meaningless piece would fit
+                if budget < min(len(text), 200):
+                    break
+                text = text[: int(budget)]
+            budget -= len(text)
+        context.append(Document(page_content=text, metadata=group["metadata"]))
+    return context
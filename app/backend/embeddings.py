@@ -0,0 +1,242 @@
+"""Embeddings with a native async path and a cache"""
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+import httpx
+from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+from langchain_core.embeddings import Embeddings
+from pydantic import PrivateAttr
+
+
+class AsyncInferenceAPIEmbeddings(HuggingFaceInferenceAPIEmbeddings):
+    """
+    `HuggingFaceInferenceAPIEmbeddings` with async calls made on a shared,
+    keep-alive httpx client instead of the default thread executor.
+    """
+
+    max_connections: int = 100
+    request_timeout: float = 60.0
+
+    _async_client: Any = PrivateAttr(default=None)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=httpx.Timeout(self.request_timeout, connect=10.0),
+            )
+        return self._async_client
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Get the embeddings for a list of texts."""
+        response = await self._get_async_client().post(
+            self._api_url,
+            headers=self._headers,
+            json={
+                "inputs": texts,
+                "options": {"wait_for_model": True, "use_cache": True},
+            },
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Get the embedding for a single text."""
+        return (await self.aembed_documents([text]))[0]
+
+    async def aclose(self) -> None:
+        """Closes the async client."""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bounded LRU cache in front of an embeddings object.
+
+    Texts are keyed by model name and whitespace-normalized text. Concurrent
+    misses for the same key share a single request to the embeddings endpoint.
+    The cache can be persisted to a local file, so warm restarts keep it.
+
+    Args:
+        embeddings (Embeddings): The embeddings object to cache.
+        model_name (str): The name of the embeddings model, part of the cache key.
+        max_size (int): Maximum number of cached embeddings.
+        cache_file (str): Optional path of the file the cache is loaded from and saved to.
+        logger: Logger object for logging messages.
+
+    Methods:
+        save: Saves the cache to the cache file.
+        stats: Returns the cache metrics.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name, max_size=10000, cache_file=None, logger=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max_size
+        self.cache_file = cache_file
+        self.logger = logger
+        self._cache: "OrderedDict[tuple, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[tuple, Future] = {}
+        self._ainflight: Dict[tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        if self.cache_file and os.path.exists(self.cache_file):
+            self._load()
+
+    def _key(self, text: str) -> tuple:
+        return (self.model_name, " ".join(text.split()))
+
+    def _get(self, key):
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return embedding
+
+    def _put(self, key, embedding):
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Get the embeddings for a list of texts, only requesting the missing ones."""
+        keys = [self._key(text) for text in texts]
+        results: Dict[tuple, List[float]] = {}
+        owned, waiting = {}, {}
+        for key, text in zip(keys, texts):
+            if key in results or key in owned or key in waiting:
+                continue
+            embedding = self._get(key)
+            if embedding is not None:
+                results[key] = embedding
+                continue
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    self.misses += 1
+                    future = self._inflight[key] = Future()
+                    owned[key] = text
+                else:
+                    waiting[key] = future
+        if owned:
+            try:
+                embeddings = self.embeddings.embed_documents(list(owned.values()))
+            except Exception as e:
+                self._release(owned, exception=e)
+                raise
+            self._release(owned, dict(zip(owned.keys(), embeddings)))
+            results.update(zip(owned.keys(), embeddings))
+        for key, future in waiting.items():
+            results[key] = future.result()
+        return [results[key] for key in keys]
+
+    def _release(self, owned, embeddings=None, exception=None):
+        with self._lock:
+            futures = [self._inflight.pop(key) for key in owned]
+        for key, future in zip(owned, futures):
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                self._put(key, embeddings[key])
+                future.set_result(embeddings[key])
+
+    def embed_query(self, text: str) -> List[float]:
+        """Get the embedding for a single text."""
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Get the embeddings for a list of texts, only requesting the missing ones."""
+        keys = [self._key(text) for text in texts]
+        results: Dict[tuple, List[float]] = {}
+        owned, waiting = {}, {}
+        for key, text in zip(keys, texts):
+            if key in results or key in owned or key in waiting:
+                continue
+            embedding = self._get(key)
+            if embedding is not None:
+                results[key] = embedding
+                continue
+            task = self._ainflight.get(key)
+            if task is None:
+                self.misses += 1
+                owned[key] = text
+            else:
+                waiting[key] = task
+        if owned:
+            # The request runs in its own task, so cancelling the request that started it
+            # doesn't cancel it for the others waiting on the same texts
+            task = asyncio.ensure_future(self._afetch(owned))
+            for key in owned:
+                self._ainflight[key] = task
+            task.add_done_callback(lambda done, keys=list(owned): self._arelease(keys, done))
+            waiting.update(dict.fromkeys(owned, task))
+        for key, task in waiting.items():
+            # Shielded, so a cancelled caller doesn't cancel the shared request
+            results[key] = (await asyncio.shield(task))[key]
+        return [results[key] for key in keys]
+
+    async def _afetch(self, owned):
+        embeddings = await self.embeddings.aembed_documents(list(owned.values()))
+        fetched = dict(zip(owned.keys(), embeddings))
+        for key, embedding in fetched.items():
+            self._put(key, embedding)
+        return fetched
+
+    def _arelease(self, keys, task):
+        for key in keys:
+            if self._ainflight.get(key) is task:
+                del self._ainflight[key]
+        if not task.cancelled():
+            # Avoid "exception never retrieved" warnings when every caller was cancelled
+            task.exception()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Get the embedding for a single text."""
+        return (await self.aembed_documents([text]))[0]
+
+    def _load(self):
+        try:
+            with open(self.cache_file, "r") as file:
+                data = json.load(file)
+            for model_name, text, embedding in data[-self.max_size:]:
+                self._cache[(model_name, text)] = embedding
+            if self.logger:
+                self.logger.info(f"Loaded {len(self._cache)} embeddings from {self.cache_file}")
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.warning(f"Could not load embeddings cache {self.cache_file}: {e}")
+
+    def save(self):
+        """Saves the cache to the cache file, if one is set."""
+        if not self.cache_file:
+            return
+        with self._lock:
+            data = [[model_name, text, embedding] for (model_name, text), embedding in self._cache.items()]
+        tmp_file = f"{self.cache_file}.tmp"
+        with open(tmp_file, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_file, self.cache_file)
+        if self.logger:
+            self.logger.info(f"Saved {len(data)} embeddings to {self.cache_file}")
+
+    def stats(self):
+        """Returns the cache metrics."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+    async def aclose(self) -> None:
+        """Saves the cache and closes the wrapped embeddings."""
+        self.save()
+        if hasattr(self.embeddings, "aclose"):
+            await self.embeddings.aclose()
@@ -0,0 +1,81 @@
+"""Retriever searching several Milvus collections at once"""
+import asyncio
+import time
+from typing import Any, List
+
+from langchain_core.callbacks import (AsyncCallbackManagerForRetrieverRun,
+                                      CallbackManagerForRetrieverRun)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    Fans a query out to several retrievers in parallel and merges their results.
+
+    All the collections are embedded with the same model and searched with the same
+    metric, so the distances they return are on the same scale and are ranked together.
+    `score_threshold` is applied to the merged set, and the `k` best documents are kept.
+    Retrievers that don't answer before the deadline are cancelled and left out.
+    """
+
+    retrievers: List[BaseRetriever]
+    k: int = 4
+    score_threshold: float = 0.99
+    deadline: float = 5.0
+    logger: Any
+
+    def _merge(self, results: List[List[Document]]) -> List[Document]:
+        merged = {}
+        for docs in results:
+            for doc in docs:
+                score = doc.metadata.get("score", float("inf"))
+                if score >= self.score_threshold:
+                    continue
+                # The same chunk can be found in several versions of a collection
+                key = (doc.metadata.get("source"), doc.page_content)
+                if key not in merged or score < merged[key].metadata["score"]:
+                    merged[key] = doc
+        return sorted(merged.values(), key=lambda doc: doc.metadata["score"])[: self.k]
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> List[Document]:
+        end = time.monotonic() + self.deadline
+        results = []
+        for retriever in self.retrievers:
+            if time.monotonic() > end:
+                self.logger.warning("Federated retrieval deadline exceeded")
+                break
+            results.append(retriever.invoke(query))
+        return self._merge(results)
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> List[Document]:
+        tasks = [asyncio.create_task(retriever.ainvoke(query)) for retriever in self.retrievers]
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.logger.warning(
+                f"Federated retrieval deadline exceeded, {len(pending)}/{len(tasks)} collection(s) left out"
+            )
+        results = []
+        for task in tasks:
+            if task in done:
+                if task.exception() is not None:
+                    self.logger.warning(f"Federated retrieval failed for one collection: {task.exception()}")
+                else:
+                    results.append(task.result())
+        if tasks and not results:
+            raise RuntimeError("No collection answered the federated retrieval")
+        return self._merge(results)
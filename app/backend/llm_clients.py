@@ -0,0 +1,69 @@
+"""Shared, keep-alive HTTP clients for the inference endpoints"""
+import httpx
+import openai
+
+
+class LLMClientPool:
+    """
+    Keeps one pooled HTTP client per inference endpoint, shared by all the requests.
+
+    The pool settings are read from the `llms` config entries:
+        max_connections (int): Maximum number of connections to the endpoint.
+        max_keepalive_connections (int): Maximum number of idle connections kept alive.
+        keepalive_expiry (float): Seconds an idle connection is kept alive.
+        request_timeout (float): Timeout of a request, in seconds.
+
+    Args:
+        logger: Logger object for logging messages.
+
+    Methods:
+        get_clients: Returns the completion clients for an LLM config.
+        aclose: Closes all the HTTP clients.
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._clients = {}
+
+    def _limits(self, llm_config):
+        return httpx.Limits(
+            max_connections=int(llm_config.get("max_connections", 100)),
+            max_keepalive_connections=int(llm_config.get("max_keepalive_connections", 20)),
+            keepalive_expiry=float(llm_config.get("keepalive_expiry", 30)),
+        )
+
+    def get_clients(self, llm_config):
+        """
+        Returns the completion clients for an LLM config, creating them on first use.
+
+        Args:
+            llm_config (dict): The LLM config entry.
+
+        Returns:
+            tuple: The sync and async OpenAI completion clients.
+        """
+        key = (llm_config.get("inference_endpoint"), llm_config.get("api_key"))
+        if key not in self._clients:
+            timeout = httpx.Timeout(float(llm_config.get("request_timeout", 600)), connect=10.0)
+            limits = self._limits(llm_config)
+            sync_client = openai.OpenAI(
+                api_key=llm_config.get("api_key"),
+                base_url=llm_config.get("inference_endpoint"),
+                http_client=httpx.Client(limits=limits, timeout=timeout),
+            )
+            async_client = openai.AsyncOpenAI(
+                api_key=llm_config.get("api_key"),
+                base_url=llm_config.get("inference_endpoint"),
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            )
+            self._clients[key] = (sync_client, async_client)
+            self.logger.info(f"Created HTTP client pool for {llm_config.get('inference_endpoint')}")
+        sync_client, async_client = self._clients[key]
+        return sync_client.completions, async_client.completions
+
+    async def aclose(self):
+        """Closes all the HTTP clients."""
+        for sync_client, async_client in self._clients.values():
+            sync_client.close()
+            await async_client.close()
+        self._clients = {}
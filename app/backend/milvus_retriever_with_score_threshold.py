@@ -1,13 +1,49 @@
 """Milvus Retriever with Score Threshold"""
+import asyncio
 import warnings
-from typing import Any, Dict, List, Optional
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Tuple
 
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.callbacks import (AsyncCallbackManagerForRetrieverRun,
+                                      CallbackManagerForRetrieverRun)
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from pydantic import model_validator
 from langchain_milvus import Milvus
 from langchain_core.retrievers import BaseRetriever
+from pymilvus import AnnSearchRequest, RRFRanker, WeightedRanker
+
+import sparse_encoder
+
+def _quote(value: str) -> str:
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def build_filter_expression(filters: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Builds a Milvus filter expression on the metadata written at ingestion.
+
+    Args:
+        filters (dict): Optional "version", "language", "title" and "header_prefix" filters.
+
+    Returns:
+        str | None: The filter expression, or None if there is nothing to filter on.
+    """
+    if not filters:
+        return None
+    conditions = []
+    if filters.get("version"):
+        conditions.append(f"version == {_quote(filters['version'])}")
+    if filters.get("language"):
+        conditions.append(f"language == {_quote(filters['language'])}")
+    if filters.get("title"):
+        conditions.append(f"title == {_quote(filters['title'])}")
+    if filters.get("header_prefix"):
+        # "%" and "_" are wildcards in a like pattern
+        prefix = str(filters["header_prefix"]).replace("%", "\\%").replace("_", "\\_")
+        conditions.append(f"header_path like {_quote(prefix + '%')}")
+    return " and ".join(conditions) or None
+
 
 class MilvusRetrieverWithScoreThreshold(BaseRetriever):
     """`Milvus API` retriever."""
@@ -19,30 +55,45 @@ class MilvusRetrieverWithScoreThreshold(BaseRetriever):
     connection_args: Optional[Dict[str, Any]] = None
     consistency_level: str = "Session"
     search_params: Optional[dict] = None
+    # Filter expression on the chunk metadata, see build_filter_expression
+    expr: Optional[str] = None
     k: int = 4
     score_threshold: float = 0.99
     enable_dynamic_field: bool =True
     text_field: str = "page_content"
     logger: Any
+    executor: Optional[Executor] = None
+    # "dense", or "hybrid" to also search the sparse field written at ingestion
+    search_mode: str = "dense"
+    # "rrf" (reciprocal rank) or "weighted" fusion of the dense and sparse results
+    fusion: str = "rrf"
+    dense_weight: float = 0.7
+    sparse_weight: float = 0.3
+    rrf_k: int = 60
+    hybrid_candidates: int = 20
+    # Query of the sparse search, without the product context prepended to the dense query:
+    # the sparse vectors have no IDF, the context words would weigh as much as the question
+    sparse_query: Optional[str] = None
 
     store: Milvus
     retriever: BaseRetriever
 
     @model_validator(mode="before")
     def create_retriever(cls, values: Dict) -> Dict:
-        """Create the Milvus store and retriever."""
-        values["store"] = Milvus(
-            embedding_function=values["embedding_function"],
-            collection_name=values["collection_name"],
-            collection_description=values["collection_description"],
-            collection_properties=values["collection_properties"],
-            connection_args=values["connection_args"],
-            consistency_level=values["consistency_level"],
-            enable_dynamic_field=True,
-            text_field="page_content"
-        )
+        """Create the Milvus store and retriever, unless an existing store is given."""
+        if values.get("store") is None:
+            values["store"] = Milvus(
+                embedding_function=values["embedding_function"],
+                collection_name=values["collection_name"],
+                collection_description=values["collection_description"],
+                collection_properties=values["collection_properties"],
+                connection_args=values["connection_args"],
+                consistency_level=values["consistency_level"],
+                enable_dynamic_field=True,
+                text_field="page_content"
+            )
         values["retriever"] = values["store"].as_retriever(
-            search_kwargs={"param": values["search_params"]}
+            search_kwargs={"param": values.get("search_params")}
         )
         return values
 
@@ -65,8 +116,95 @@ class MilvusRetrieverWithScoreThreshold(BaseRetriever):
         **kwargs: Any,
     ) -> List[Document]:
         self.logger.info(f"Store: {self.store.collection_name}")
-        docs_and_scores = self.store.similarity_search_with_score(query, k=self.k, return_metadata=True)
+        if self._use_hybrid():
+            return self._hybrid_search(query, self.embedding_function.embed_query(query))
+        docs_and_scores = self.store.similarity_search_with_score(
+            query, k=self.k, param=self.search_params, expr=self.expr, return_metadata=True
+        )
+        return self._filter_by_score(docs_and_scores)
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> List[Document]:
+        self.logger.info(f"Store: {self.store.collection_name}")
+        embedding = await self.embedding_function.aembed_query(query)
+        # pymilvus search is sync-only, it runs on the bounded executor
+        loop = asyncio.get_running_loop()
+        if self._use_hybrid():
+            return await loop.run_in_executor(
+                self.executor, lambda: self._hybrid_search(query, embedding)
+            )
+        docs_and_scores = await loop.run_in_executor(
+            self.executor,
+            lambda: self.store.similarity_search_with_score_by_vector(
+                embedding, k=self.k, param=self.search_params, expr=self.expr
+            ),
+        )
+        return self._filter_by_score(docs_and_scores)
+
+    def _filter_by_score(self, docs_and_scores: List[Tuple[Document, float]]) -> List[Document]:
         docs_and_scores = [(doc, score) for doc, score in docs_and_scores if score < self.score_threshold]
         for doc, score in docs_and_scores:
             doc.metadata = {**doc.metadata, **{"score": score}}
         return [doc for (doc, _) in docs_and_scores]
+
+    def _use_hybrid(self) -> bool:
+        """Hybrid search is only possible on collections ingested with a sparse field."""
+        if self.search_mode != "hybrid" or self.store.col is None:
+            return False
+        return any(field.name == "sparse" for field in self.store.col.schema.fields)
+
+    def _hybrid_search(self, query: str, embedding: List[float]) -> List[Document]:
+        """Dense and sparse search in a single request, fused by Milvus."""
+        dense_params = self.search_params or self.store.search_params
+        requests = [
+            AnnSearchRequest(
+                data=[embedding],
+                anns_field="vector",
+                param=dense_params,
+                limit=self.hybrid_candidates,
+                expr=self.expr,
+            ),
+            AnnSearchRequest(
+                data=[sparse_encoder.encode_query(self.sparse_query or query)],
+                anns_field="sparse",
+                param={"metric_type": "IP", "params": {"drop_ratio_search": 0.0}},
+                limit=self.hybrid_candidates,
+                expr=self.expr,
+            ),
+        ]
+        if self.fusion == "weighted":
+            ranker = WeightedRanker(self.dense_weight, self.sparse_weight)
+        else:
+            ranker = RRFRanker(self.rrf_k)
+        results = self.store.col.hybrid_search(
+            requests, rerank=ranker, limit=self.k, output_fields=["*"]
+        )
+
+        # The fused scores are not distances: the dense distance is computed again, so the
+        # "score" of the documents keeps the same meaning as in dense mode. The score threshold
+        # is not applied, lexical matches can be far from the query in the dense space.
+        metric_type = dense_params.get("metric_type", "L2") if dense_params else "L2"
+        docs = []
+        for hit in results[0]:
+            fields = dict(hit.fields)
+            vector = fields.pop("vector", None)
+            fields.pop("sparse", None)
+            page_content = fields.pop(self.text_field, "")
+            if vector is not None and metric_type == "L2":
+                score = sum((a - b) ** 2 for a, b in zip(vector, embedding))
+            elif vector is not None:
+                score = sum(a * b for a, b in zip(vector, embedding))
+            else:
+                score = hit.distance
+            docs.append(
+                Document(
+                    page_content=page_content,
+                    metadata={**fields, "pk": hit.id, "score": score, "hybrid_score": hit.distance},
+                )
+            )
+        return docs
@@ -0,0 +1,138 @@
+"""Pool of long-lived Milvus stores shared by all queries"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_milvus import Milvus
+from pymilvus import utility
+
+
+class _PooledStore:
+    def __init__(self, store: Milvus):
+        self.store = store
+        self.last_checked = time.monotonic()
+
+
+class MilvusStorePool:
+    """
+    Keeps one `langchain_milvus.Milvus` store per collection name, so the
+    connection, collection describe and load check are only paid once.
+
+    Args:
+        embedding_function (Embeddings): Embeddings used by every store.
+        connection_args (dict): Milvus connection arguments.
+        logger: Logger object for logging messages.
+        max_size (int): Maximum number of stores kept open, least recently used are evicted first.
+        health_check_interval (float): Seconds between two health checks of a pooled store.
+        consistency_level (str): Consistency level used for the stores.
+
+    Methods:
+        get: Returns a healthy store for a collection, creating it if needed.
+        invalidate: Removes a store from the pool, forcing a reconnect on next use.
+        clear: Removes all the stores from the pool.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        connection_args: Dict[str, Any],
+        logger,
+        max_size: int = 32,
+        health_check_interval: float = 30.0,
+        consistency_level: str = "Session",
+    ):
+        self.embedding_function = embedding_function
+        self.connection_args = connection_args
+        self.logger = logger
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.consistency_level = consistency_level
+        self._stores: "OrderedDict[str, _PooledStore]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._creation_locks: Dict[str, threading.Lock] = {}
+
+    def _create_store(self, collection_name: str) -> Milvus:
+        return Milvus(
+            embedding_function=self.embedding_function,
+            collection_name=collection_name,
+            collection_description="",
+            collection_properties=None,
+            connection_args=self.connection_args,
+            consistency_level=self.consistency_level,
+            enable_dynamic_field=True,
+            text_field="page_content",
+        )
+
+    def _is_healthy(self, pooled: _PooledStore) -> bool:
+        """Checks that the connection still works and the store still matches the collection state."""
+        if time.monotonic() - pooled.last_checked < self.health_check_interval:
+            return True
+        store = pooled.store
+        try:
+            # A store created before its collection existed must be recreated to pick it up
+            healthy = utility.has_collection(
+                store.collection_name, using=store.alias
+            ) == (store.col is not None)
+        except Exception as e:
+            self.logger.warning(f"Health check failed for {store.collection_name}: {e}")
+            healthy = False
+        if healthy:
+            pooled.last_checked = time.monotonic()
+        return healthy
+
+    def _lookup(self, collection_name: str) -> Optional[_PooledStore]:
+        with self._lock:
+            pooled = self._stores.get(collection_name)
+            if pooled is not None:
+                self._stores.move_to_end(collection_name)
+            return pooled
+
+    def get(self, collection_name: str) -> Milvus:
+        """
+        Returns a healthy store for a collection, creating it if needed.
+
+        Args:
+            collection_name (str): The name of the Milvus collection.
+
+        Returns:
+            Milvus: The pooled store.
+        """
+        pooled = self._lookup(collection_name)
+        if pooled is not None and self._is_healthy(pooled):
+            return pooled.store
+        if pooled is not None:
+            self.logger.info(f"Reconnecting store for {collection_name}")
+            self.invalidate(collection_name)
+
+        # Only one thread creates a given store, others wait for it
+        with self._lock:
+            creation_lock = self._creation_locks.setdefault(collection_name, threading.Lock())
+        with creation_lock:
+            pooled = self._lookup(collection_name)
+            if pooled is not None:
+                return pooled.store
+            store = self._create_store(collection_name)
+            with self._lock:
+                self._stores[collection_name] = _PooledStore(store)
+                while len(self._stores) > self.max_size:
+                    evicted_name, _ = self._stores.popitem(last=False)
+                    self.logger.info(f"Evicted store for {evicted_name} from pool")
+            self.logger.info(f"Created store for {collection_name}")
+            return store
+
+    def invalidate(self, collection_name: str) -> None:
+        """
+        Removes a store from the pool, forcing a reconnect on next use.
+
+        Args:
+            collection_name (str): The name of the Milvus collection.
+        """
+        with self._lock:
+            self._stores.pop(collection_name, None)
+
+    def clear(self) -> None:
+        """Removes all the stores from the pool."""
+        with self._lock:
+            self._stores.clear()
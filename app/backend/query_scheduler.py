@@ -0,0 +1,142 @@
+"""Per-connection scheduling of the queries received on a websocket"""
+import asyncio
+import contextlib
+import json
+import uuid
+
+from fastapi import WebSocket
+
+
+class QueryScheduler:
+    """
+    Runs the queries of one websocket connection.
+
+    Every query gets a request id (the one sent by the client, or a generated one),
+    and every frame streamed back is tagged with it. Frames go through a queue
+    drained by a single writer. The frames of the answers are bounded, so a slow
+    reader slows down its own queries instead of piling up buffers in memory. The
+    replies to the client messages never wait, so the receive loop keeps reading
+    cancellations, and new queries are rejected while the answers are backed up.
+
+    Args:
+        websocket (WebSocket): The client connection.
+        chatbot: The Chatbot answering the queries.
+        logger: Logger object for logging messages.
+        max_inflight (int): Maximum number of queries running at the same time.
+        send_queue_size (int): Maximum number of answer frames waiting to be sent.
+
+    Methods:
+        start: Starts the writer task.
+        submit: Starts answering a query.
+        cancel: Cancels a running query.
+        close: Cancels all the running queries and the writer.
+    """
+
+    def __init__(self, websocket: WebSocket, chatbot, logger, max_inflight=4, send_queue_size=64):
+        self.websocket = websocket
+        self.chatbot = chatbot
+        self.logger = logger
+        self.max_inflight = max_inflight
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.send_queue_size = send_queue_size
+        # Frames and whether they hold one of the answer slots
+        self.send_queue: asyncio.Queue = asyncio.Queue()
+        self.answer_slots = asyncio.Semaphore(send_queue_size)
+        self.writer: asyncio.Task | None = None
+
+    def start(self):
+        """Starts the writer task."""
+        self.writer = asyncio.create_task(self._write())
+
+    async def _write(self):
+        while True:
+            frame, answer = await self.send_queue.get()
+            if answer:
+                self.answer_slots.release()
+            await self.websocket.send_text(json.dumps(frame))
+
+    async def _send(self, request_id, frame):
+        """Queues a frame of an answer, waits while the answer frames are backed up."""
+        await self.answer_slots.acquire()
+        self.send_queue.put_nowait(({**frame, "request_id": request_id}, True))
+
+    def _reply(self, request_id, frame):
+        """Queues a reply to a client message without waiting."""
+        if self.send_queue.qsize() >= 2 * self.send_queue_size:
+            # The client sends messages but doesn't read the replies
+            self.logger.warning(f"Dropped {frame['type']} reply to {request_id}, send queue full")
+            return
+        self.send_queue.put_nowait(({**frame, "request_id": request_id}, False))
+
+    async def _run(self, request_id, data):
+        try:
+            # Closed right away on cancellation, so the LLM stream and its producer stop with it
+            async with contextlib.aclosing(self.chatbot.stream(
+                data["model"],
+                data["query"],
+                data.get("collection", "none"),
+                data.get("collection_full_name", "None"),
+                data.get("version", "None"),
+                data["language"],
+                collections=data.get("collections"),
+                filters=data.get("filters"),
+            )) as stream:
+                async for next_item in stream:
+                    await self._send(request_id, next_item)
+        except KeyError as e:
+            await self._send(request_id, {"type": "error", "error": f"Missing field: {e}"})
+        except asyncio.CancelledError:
+            # Cancelled by the client or on close, nothing more is sent
+            raise
+        except Exception as e:
+            # The client still gets an end frame, and the other queries go on
+            self.logger.exception(f"Error while answering query {request_id}: {e}")
+            await self._send(request_id, {"type": "error", "error": str(e)})
+        finally:
+            self.tasks.pop(request_id, None)
+        await self._send(request_id, {"type": "end"})
+
+    async def submit(self, data: dict):
+        """
+        Starts answering a query.
+
+        Args:
+            data (dict): The query message received from the client.
+        """
+        request_id = str(data.get("request_id") or uuid.uuid4().hex)
+        if request_id in self.tasks:
+            self._reply(request_id, {"type": "error", "error": "Duplicate request id"})
+            return
+        if len(self.tasks) >= self.max_inflight:
+            self._reply(request_id, {"type": "error", "error": "Too many queries in flight"})
+            return
+        if self.answer_slots.locked():
+            self._reply(request_id, {"type": "error", "error": "Overloaded, answers are not read fast enough"})
+            return
+        self.tasks[request_id] = asyncio.create_task(self._run(request_id, data))
+
+    async def cancel(self, request_id):
+        """
+        Cancels a running query.
+
+        Args:
+            request_id (str): The id of the query to cancel.
+        """
+        request_id = str(request_id)
+        task = self.tasks.pop(request_id, None)
+        if task is not None:
+            task.cancel()
+            self.logger.info(f"Cancelled query {request_id}")
+            self._reply(request_id, {"type": "cancelled"})
+
+    async def close(self):
+        """Cancels all the running queries and the writer."""
+        tasks = list(self.tasks.values())
+        if self.writer is not None:
+            tasks.append(self.writer)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await task
+        self.tasks = {}
@@ -0,0 +1,102 @@
+"""Optional cross-encoder reranking of the retrieved documents"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from langchain_core.documents import Document
+
+
+class CrossEncoderReranker:
+    """
+    Reranks retrieved documents with a small cross-encoder running on CPU.
+
+    All the candidates are scored in a single batch. If scoring doesn't finish within
+    the latency budget, reranking is skipped and the retrieval order is kept.
+    The model runs on its own single thread, so a scoring job that overran its budget
+    and can't be interrupted only delays the next reranking, not the retrieval. While
+    max_pending jobs are running or queued, reranking is skipped right away.
+    Needs the `sentence-transformers` package, reranking is disabled if it is missing.
+
+    Args:
+        model_name (str): The name or path of the cross-encoder model.
+        logger: Logger object for logging messages.
+        top_n (int): Number of documents kept after reranking.
+        budget_ms (float): Latency budget of the reranking stage, in milliseconds.
+        max_length (int): Maximum length of a (query, document) pair, in tokens.
+        max_pending (int): Maximum number of scoring jobs running or queued.
+
+    Methods:
+        arerank: Reranks documents for a query.
+        close: Stops the thread running the model.
+    """
+
+    def __init__(self, model_name, logger, top_n=4, budget_ms=300, max_length=512, max_pending=2):
+        self.logger = logger
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        # Scoring jobs submitted and not finished, the ones past their budget included
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self.model = None
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            self.logger.warning("sentence-transformers is not installed, reranking is disabled")
+            return
+        self.model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self.logger.info(f"Loaded reranking model {model_name}")
+
+    @property
+    def enabled(self):
+        return self.model is not None
+
+    def _score(self, query: str, docs: List[Document]):
+        pairs = [(query, doc.page_content) for doc in docs]
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    async def arerank(self, query: str, docs: List[Document]) -> List[Document]:
+        """
+        Reranks documents for a query.
+
+        Args:
+            query (str): The query.
+            docs (list): The retrieved documents, best first.
+
+        Returns:
+            list: The top_n documents, best first.
+        """
+        if not self.enabled or len(docs) <= 1:
+            return docs[: self.top_n]
+        with self._pending_lock:
+            if self._pending >= self.max_pending:
+                self.logger.warning("Reranking model busy, skipped")
+                return docs[: self.top_n]
+            self._pending += 1
+        start = time.perf_counter()
+        job = self.executor.submit(self._score, query, docs)
+        job.add_done_callback(self._release)
+        try:
+            # A queued job is cancelled on timeout, a running one can only be left to finish
+            scores = await asyncio.wait_for(asyncio.wrap_future(job), timeout=self.budget_ms / 1000)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Reranking exceeded its {self.budget_ms}ms budget, skipped")
+            return docs[: self.top_n]
+        ranked = sorted(zip(docs, scores), key=lambda item: item[1], reverse=True)
+        for doc, score in ranked:
+            doc.metadata = {**doc.metadata, "rerank_score": float(score)}
+        self.logger.info(
+            f"Reranked {len(docs)} documents in {(time.perf_counter() - start) * 1000:.1f}ms"
+        )
+        return [doc for doc, _ in ranked[: self.top_n]]
+
+    def _release(self, job):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def close(self):
+        """Stops the thread running the model, queued jobs are cancelled."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,170 @@
+"""Semantic cache of the answers given to previous queries"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _CachedAnswer:
+    def __init__(self, key, query, embedding, frames):
+        self.key = key
+        self.query = query
+        self.embedding = embedding
+        self.frames = frames
+        self.created = time.monotonic()
+        self.size = embedding.nbytes + sum(
+            len(frame.get("token", "")) + len(str(frame.get("source", ""))) for frame in frames
+        )
+
+
+class SemanticResponseCache:
+    """
+    Keeps the frames streamed for previous queries, to replay them for similar queries.
+
+    Entries are grouped by (model, collection, version, language). A query first
+    matches on its normalized text, then on the cosine similarity of its embedding
+    with the cached queries of the same group.
+
+    Args:
+        logger: Logger object for logging messages.
+        similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+        ttl_seconds (float): Time after which an entry expires.
+        max_entries (int): Maximum number of cached answers.
+        max_bytes (int): Approximate maximum memory used by the cached answers.
+
+    Methods:
+        lookup_text: Looks up an answer by normalized query text.
+        lookup: Looks up an answer by query embedding.
+        store: Stores the frames of an answer.
+        stats: Returns the cache metrics.
+    """
+
+    def __init__(
+        self,
+        logger,
+        similarity_threshold=0.95,
+        ttl_seconds=3600,
+        max_entries=1000,
+        max_bytes=64 * 1024 * 1024,
+    ):
+        self.logger = logger
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, _CachedAnswer]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(query):
+        return " ".join(query.lower().split())
+
+    def _expired(self, entry):
+        return time.monotonic() - entry.created > self.ttl_seconds
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry.size
+
+    def _hit(self, entry_id):
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return self._entries[entry_id].frames
+
+    def lookup_text(self, key, query):
+        """
+        Looks up an answer by normalized query text, without needing an embedding.
+
+        Args:
+            key (tuple): The (model, collection, version, language) group.
+            query (str): The user's query.
+
+        Returns:
+            list | None: The cached frames, or None.
+        """
+        entry_id = (key, self._normalize(query))
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(entry_id)
+                return None
+            return self._hit(entry_id)
+
+    def lookup(self, key, embedding):
+        """
+        Looks up an answer by query embedding.
+
+        Args:
+            key (tuple): The (model, collection, version, language) group.
+            embedding (list[float]): The embedding of the query.
+
+        Returns:
+            list | None: The cached frames, or None.
+        """
+        vector = self._unit(embedding)
+        best_id, best_score = None, self.similarity_threshold
+        with self._lock:
+            for entry_id, entry in list(self._entries.items()):
+                if entry.key != key:
+                    continue
+                if self._expired(entry):
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(entry.embedding, vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.semantic_hits += 1
+            return self._hit(best_id)
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def store(self, key, query, embedding, frames):
+        """
+        Stores the frames of an answer.
+
+        Args:
+            key (tuple): The (model, collection, version, language) group.
+            query (str): The user's query.
+            embedding (list[float]): The embedding of the query.
+            frames (list[dict]): The token and source frames streamed for the answer.
+        """
+        entry_id = (key, self._normalize(query))
+        entry = _CachedAnswer(key, query, self._unit(embedding), frames)
+        with self._lock:
+            if entry_id in self._entries:
+                self._remove(entry_id)
+            self._entries[entry_id] = entry
+            self._bytes += entry.size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def stats(self):
+        """Returns the cache metrics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,72 @@
+"""Stateless BM25-style sparse encoder used for hybrid search
+
+The same module is used at ingestion and at query time, so both sides produce
+the same sparse vectors without sharing a fitted corpus model. The ingestion and
+the backend each ship a copy, test_sparse_encoder.py checks they stay the same.
+"""
+import re
+import zlib
+from collections import Counter
+
+# Keeps CLI flags with their leading dashes, CRD names, versions and error codes as single tokens
+_TOKEN = re.compile(r"-{0,2}[a-z0-9][a-z0-9_\-./:]*[a-z0-9]|-{0,2}[a-z0-9]")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "this",
+    "to", "we", "what", "when", "which", "with", "you", "your", "about", "talking",
+    "section", "content",
+}
+
+# Size of the hashed vocabulary
+DIMENSION = 2**31 - 1
+
+
+def tokenize(text):
+    """Lowercases and splits a text into the tokens used by the sparse vectors."""
+    return [
+        token for token in _TOKEN.findall(text.lower().replace("search_query:", " ").replace("search_document:", " "))
+        if token not in _STOPWORDS
+    ]
+
+
+def _index(token):
+    return zlib.crc32(token.encode("utf-8")) % DIMENSION
+
+
+def encode_document(text, k1=1.2, b=0.75, avg_length=128):
+    """
+    Encodes a document with BM25 term-frequency saturation.
+
+    Args:
+        text (str): The document content.
+        k1 (float): BM25 term-frequency saturation.
+        b (float): BM25 length normalization.
+        avg_length (int): Expected average document length, in tokens.
+
+    Returns:
+        dict: The sparse vector, as {index: weight}.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        # Milvus doesn't accept empty sparse vectors
+        return {0: 1e-6}
+    length_norm = k1 * (1 - b + b * len(tokens) / avg_length)
+    vector = {}
+    for token, tf in Counter(tokens).items():
+        index = _index(token)
+        vector[index] = vector.get(index, 0.0) + tf * (k1 + 1) / (tf + length_norm)
+    return vector
+
+
+def encode_query(text):
+    """
+    Encodes a query, every distinct token weighs 1.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        dict: The sparse vector, as {index: weight}.
+    """
+    return {_index(token): 1.0 for token in set(tokenize(text))}
@@ -0,0 +1,93 @@
+"""Benchmark of the per-query retriever setup latency, with and without the store pool
+
+Usage:
+    CONFIG_FILE=config.json python store_pool_benchmark.py <collection_name> [iterations]
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
+
+from helpers import logging_config
+from milvus_retriever_with_score_threshold import \
+    MilvusRetrieverWithScoreThreshold
+from milvus_store_pool import MilvusStorePool
+
+logging_config()
+_logger = logging.getLogger(__name__)
+
+
+def build_retriever(embeddings, collection_name, connection_args, store=None):
+    return MilvusRetrieverWithScoreThreshold(
+        embedding_function=embeddings,
+        collection_name=collection_name,
+        collection_description="",
+        collection_properties=None,
+        connection_args=connection_args,
+        consistency_level="Session",
+        search_params=None,
+        store=store,
+        k=4,
+        score_threshold=0.99,
+        enable_dynamic_field=True,
+        text_field="page_content",
+        logger=_logger,
+    )
+
+
+def report(label, timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[min(len(timings_ms) - 1, int(len(timings_ms) * 0.95))]
+    print(
+        f"{label:<12} mean={statistics.mean(timings_ms):8.2f}ms "
+        f"p50={statistics.median(timings_ms):8.2f}ms p95={p95:8.2f}ms"
+    )
+
+
+def main():
+    collection_name = sys.argv[1]
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    with open(os.getenv("CONFIG_FILE", "config.json"), "r") as file:
+        config = json.load(file)
+    vectorstore = config.get("vectorstore", {})
+    connection_args = {
+        "uri": vectorstore.get("uri", "http://localhost:19530"),
+        "user": vectorstore.get("user", ""),
+        "password": vectorstore.get("password", ""),
+        "db_name": vectorstore.get("db_name", "default"),
+    }
+    embeddings = HuggingFaceInferenceAPIEmbeddings(
+        api_url=config.get("embeddings").get("inference_endpoint"),
+        api_key=config.get("embeddings").get("api_key"),
+        model_name=config.get("embeddings").get("model_name"),
+    )
+
+    # Before: a new store is created for every query
+    before = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        build_retriever(embeddings, collection_name, connection_args)
+        before.append(time.perf_counter() - start)
+
+    # After: stores are taken from the pool, the first call pays the creation
+    pool = MilvusStorePool(embeddings, connection_args, _logger)
+    after = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        build_retriever(
+            embeddings, collection_name, connection_args, store=pool.get(collection_name)
+        )
+        after.append(time.perf_counter() - start)
+
+    print(f"Retriever setup latency for {collection_name} over {iterations} queries")
+    report("per-query", before)
+    report("pooled", after)
+
+
+if __name__ == "__main__":
+    main()
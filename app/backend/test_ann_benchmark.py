@@ -0,0 +1,51 @@
+"""The benchmark reads the dense index of a hybrid collection, in a local Milvus Lite file
+
+Run with: python -m pytest test_ann_benchmark.py
+"""
+import pytest
+
+pytest.importorskip("milvus_lite")
+
+from pymilvus import Collection, DataType, MilvusClient, connections
+
+import ann_benchmark
+
+
+@pytest.fixture
+def hybrid_collection(tmp_path):
+    uri = str(tmp_path / "milvus.db")
+    client = MilvusClient(uri)
+    schema = client.create_schema(auto_id=True, enable_dynamic_field=True)
+    schema.add_field("pk", DataType.INT64, is_primary=True)
+    schema.add_field("vector", DataType.FLOAT_VECTOR, dim=4)
+    schema.add_field("sparse", DataType.SPARSE_FLOAT_VECTOR)
+    schema.add_field("version", DataType.VARCHAR, max_length=64)
+    # Same indexes as the ingestion, the sparse one listed first
+    index_params = client.prepare_index_params()
+    index_params.add_index(field_name="sparse", index_type="SPARSE_INVERTED_INDEX", metric_type="IP")
+    index_params.add_index(field_name="vector", index_type="AUTOINDEX", metric_type="L2")
+    client.create_collection("docs_4_18", schema=schema, index_params=index_params)
+    client.insert("docs_4_18", [
+        {"vector": [float(i), 0.0, 1.0, 2.0], "sparse": {i + 1: 1.0}, "version": "4.18"} for i in range(10)
+    ])
+    connections.connect(alias="benchmark", uri=uri)
+    collection = Collection("docs_4_18", using="benchmark")
+    collection.load()
+    yield collection
+    connections.disconnect("benchmark")
+    client.close()
+
+
+def test_vector_index_of_hybrid_collection(hybrid_collection):
+    index = ann_benchmark.vector_index(hybrid_collection)
+    assert index["metric_type"] == "L2"
+    assert index["index_type"] == "AUTOINDEX"
+
+
+def test_exact_search_matches_the_collection(hybrid_collection):
+    pks, vectors = ann_benchmark.load_vectors(hybrid_collection)
+    assert len(pks) == 10
+    query = vectors[3].tolist()
+    expected = ann_benchmark.exact_search(pks, vectors, query, 1)
+    _, results = ann_benchmark.run_setting(hybrid_collection, [query], 1, {}, "L2")
+    assert results[0] == expected
@@ -0,0 +1,125 @@
+"""Translation of the queries to English, with a cache"""
+import re
+import threading
+from collections import OrderedDict
+
+# Labels some models put in front of their translation
+_ANSWER_PREFIX = re.compile(
+    r"^\s*(English translation|Translation|English|Answer)\s*:\s*", re.IGNORECASE
+)
+
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+_ENGLISH_WORDS = {
+    "a", "an", "and", "are", "can", "do", "does", "for", "from", "how", "i",
+    "in", "is", "it", "my", "of", "on", "or", "the", "this", "to", "what",
+    "when", "where", "which", "why", "with", "you", "should",
+}
+
+_OTHER_WORDS = {
+    # French
+    "le", "la", "les", "des", "est", "une", "et", "pour", "comment", "je",
+    "quoi", "avec", "dans", "sur", "du", "au", "quel", "quelle",
+    # German
+    "der", "die", "das", "und", "ist", "wie", "ich", "mit", "ein", "eine",
+    "nicht", "für", "kann", "welche",
+    # Spanish
+    "el", "los", "las", "es", "y", "para", "cómo", "como", "qué", "que",
+    "con", "una", "puedo", "por",
+}
+
+
+def clean_translation(text):
+    """Removes the labels and whitespace around a translated query."""
+    text = str(text).strip()
+    previous = None
+    while previous != text:
+        previous = text
+        text = _ANSWER_PREFIX.sub("", text).strip()
+    return text
+
+
+def is_probably_english(text):
+    """
+    Cheap local check telling if a query is already in English.
+
+    Args:
+        text (str): The query.
+
+    Returns:
+        bool: True if the query looks like English.
+    """
+    words = [word.lower() for word in _WORD.findall(text)]
+    if not words:
+        return True
+    letters = "".join(words)
+    if sum(1 for char in letters if char.isascii()) / len(letters) < 0.95:
+        return False
+    english = sum(1 for word in words if word in _ENGLISH_WORDS)
+    other = sum(1 for word in words if word in _OTHER_WORDS)
+    return english > other
+
+
+class QueryTranslator:
+    """
+    Translates queries to English with an LLM, with a bounded LRU cache.
+
+    Args:
+        logger: Logger object for logging messages.
+        max_size (int): Maximum number of cached translations.
+
+    Methods:
+        translate: Translates a query to English.
+        stats: Returns the cache metrics.
+    """
+
+    def __init__(self, logger, max_size=1000):
+        self.logger = logger
+        self.max_size = max_size
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    async def translate(self, llm, translate_prompt, model, language, query):
+        """
+        Translates a query to English.
+
+        Args:
+            llm: The LLM used for the translation.
+            translate_prompt (str): The translation prompt, with an {input} placeholder.
+            model (str): The name of the model, part of the cache key.
+            language (str): The language of the query, part of the cache key.
+            query (str): The user's query.
+
+        Returns:
+            str: The query in English.
+        """
+        if is_probably_english(query):
+            self.skipped += 1
+            return query
+        key = (model, language, " ".join(query.split()))
+        with self._lock:
+            translation = self._cache.get(key)
+            if translation is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return translation
+            self.misses += 1
+        translation = clean_translation(await llm.ainvoke(translate_prompt.format(input=query)))
+        with self._lock:
+            self._cache[key] = translation
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return translation
+
+    def stats(self):
+        """Returns the cache metrics."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "entries": len(self._cache),
+            }
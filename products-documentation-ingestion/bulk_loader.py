@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import time
+
+import pyarrow.parquet as pq
+from minio import Minio
+from pymilvus import BulkInsertState, utility
+from pymilvus.bulk_writer import BulkFileType, LocalBulkWriter
+
+# Name of the column holding the dynamic fields in the staged files
+DYNAMIC_FIELD = "$meta"
+
+
+class BulkLoader:
+    """
+    Stages the rows of a collection in Parquet files on local disk, and loads them into
+    Milvus in one go once the whole collection is embedded.
+
+    With object storage settings, the files are uploaded to the bucket of the Milvus
+    server and imported with bulk insert, Milvus builds the segments and the indexes
+    itself. Without them (Milvus Lite, or a server whose bucket isn't reachable), the
+    files are read back and inserted with large insert calls.
+
+    Args:
+        client (MilvusClient): Client of the Milvus server.
+        connection_alias (str): Alias of the ORM connection to the same server.
+        staging_dir (str): Local directory of the staged files.
+        s3_endpoint (str): Endpoint of the object storage of Milvus, empty to insert the rows.
+        s3_access_key (str): Access key of the object storage.
+        s3_secret_key (str): Secret key of the object storage.
+        s3_bucket (str): Bucket of the object storage used by Milvus.
+        s3_secure (bool): Whether the object storage is reached over TLS.
+        insert_batch_size (int): Rows per insert call, without object storage.
+        timeout (float): Maximum duration of an import, in seconds.
+
+    Methods:
+        stage: Returns a writer staging rows with the schema of a collection.
+        load: Loads the staged rows into a collection, then removes the files.
+    """
+
+    def __init__(
+        self,
+        client,
+        connection_alias,
+        staging_dir,
+        s3_endpoint="",
+        s3_access_key="",
+        s3_secret_key="",
+        s3_bucket="a-bucket",
+        s3_secure=False,
+        insert_batch_size=10000,
+        timeout=3600.0,
+    ):
+        self.client = client
+        self.connection_alias = connection_alias
+        self.staging_dir = staging_dir
+        self.s3_bucket = s3_bucket
+        self.insert_batch_size = insert_batch_size
+        self.timeout = timeout
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self.storage = None
+        if s3_endpoint:
+            self.storage = Minio(s3_endpoint, access_key=s3_access_key, secret_key=s3_secret_key, secure=s3_secure)
+
+    def stage(self, schema):
+        """Writer of rows with the schema of a collection, in its own subdirectory of the staging directory."""
+        # Resolves the primary and partition key fields of a schema built field by field
+        schema.verify()
+        return LocalBulkWriter(schema=schema, local_path=self.staging_dir, file_type=BulkFileType.PARQUET)
+
+    def load(self, collection_name, writer):
+        """Load the rows staged by a writer into a collection, returns the number of rows."""
+        writer.commit()
+        try:
+            if self.storage is not None:
+                return self._bulk_insert(collection_name, writer.batch_files)
+            return self._insert(collection_name, writer.batch_files)
+        finally:
+            shutil.rmtree(writer.data_path, ignore_errors=True)
+
+    def _bulk_insert(self, collection_name, batch_files):
+        uploaded = []
+        try:
+            tasks = []
+            for files in batch_files:
+                objects = []
+                for path in files:
+                    object_name = f"ingestion/{os.path.relpath(path, self.staging_dir)}"
+                    self.storage.fput_object(self.s3_bucket, object_name, path)
+                    uploaded.append(object_name)
+                    objects.append(object_name)
+                tasks.append(utility.do_bulk_insert(collection_name, files=objects, using=self.connection_alias))
+            print(f"Importing {len(uploaded)} file(s) into {collection_name}")
+            return self._wait(collection_name, tasks)
+        finally:
+            for object_name in uploaded:
+                self.storage.remove_object(self.s3_bucket, object_name)
+
+    def _wait(self, collection_name, tasks):
+        rows = 0
+        deadline = time.monotonic() + self.timeout
+        while tasks:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Bulk insert into {collection_name} not finished after {self.timeout}s")
+            time.sleep(2)
+            for task_id in list(tasks):
+                state = utility.get_bulk_insert_state(task_id, using=self.connection_alias)
+                if state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+                    raise RuntimeError(f"Bulk insert into {collection_name} failed: {state.failed_reason}")
+                if state.state == BulkInsertState.ImportCompleted:
+                    rows += state.row_count
+                    tasks.remove(task_id)
+        return rows
+
+    def _insert(self, collection_name, batch_files):
+        rows = 0
+        for files in batch_files:
+            for path in files:
+                parquet_file = pq.ParquetFile(path)
+                for record_batch in parquet_file.iter_batches(batch_size=self.insert_batch_size):
+                    batch = [self._row(row) for row in record_batch.to_pylist()]
+                    self.client.insert(collection_name, batch)
+                    rows += len(batch)
+        return rows
+
+    @staticmethod
+    def _row(row):
+        """Row of an insert call from a staged row, JSON columns are stored as strings"""
+        row.update(json.loads(row.pop(DYNAMIC_FIELD, None) or "{}"))
+        if isinstance(row.get("sparse"), str):
+            row["sparse"] = {int(index): value for index, value in json.loads(row["sparse"]).items()}
+        return row
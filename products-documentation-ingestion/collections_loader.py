@@ -36,7 +36,8 @@ class CollectionLoader:
             collection_base_name=data.get("collection_base_name"),
             collection_full_name=data.get("collection_full_name"),
             versions=versions,
-            common_sources=common_sources
+            common_sources=common_sources,
+            index=data.get("index")
         )
 
         return collection
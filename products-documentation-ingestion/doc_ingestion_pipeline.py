@@ -15,6 +15,9 @@ from documentation_ingestion import doc_ingest
 ######### Pipeline definition #########
 
 ingestion_secret_name = 'doc-ingestion'
+# Work log and page manifest of the ingestion, kept across runs
+ingestion_state_pvc_name = 'doc-ingestion-state'
+ingestion_state_mount_path = '/opt/app-root/src/ingestion-state'
 
 # Create pipeline
 @dsl.pipeline(
@@ -40,6 +43,20 @@ def doc_ingestion_pipeline():
             'EMBEDDINGS_API_URL': 'EMBEDDINGS_API_URL',
             'EMBEDDINGS_API_KEY': 'EMBEDDINGS_API_KEY',
             'EMBEDDINGS_MODEL_NAME': 'EMBEDDINGS_MODEL_NAME',
+            'HYBRID_SEARCH': 'HYBRID_SEARCH',
+            'COLLECTION_LAYOUT': 'COLLECTION_LAYOUT',
+            'INCREMENTAL_INGESTION': 'INCREMENTAL_INGESTION',
+            'BULK_LOAD': 'BULK_LOAD',
+            'BULK_LOAD_S3_ENDPOINT': 'BULK_LOAD_S3_ENDPOINT',
+            'BULK_LOAD_S3_ACCESS_KEY': 'BULK_LOAD_S3_ACCESS_KEY',
+            'BULK_LOAD_S3_SECRET_KEY': 'BULK_LOAD_S3_SECRET_KEY',
+            'BULK_LOAD_S3_BUCKET': 'BULK_LOAD_S3_BUCKET',
+            'INGESTION_CONCURRENCY': 'INGESTION_CONCURRENCY',
+            'INGESTION_CONCURRENCY_PER_HOST': 'INGESTION_CONCURRENCY_PER_HOST',
+            'BLUE_GREEN': 'BLUE_GREEN',
+            'BLUE_GREEN_KEEP': 'BLUE_GREEN_KEEP',
+            'INGESTION_WORKLOG_PATH': 'INGESTION_WORKLOG_PATH',
+            'INGESTION_MANIFEST_PATH': 'INGESTION_MANIFEST_PATH',
             'DOCLING_API_URL': 'DOCLING_API_URL',
             'DOCLING_API_KEY': 'DOCLING_API_KEY',
             'COLLECTIONS_PATH': 'COLLECTIONS_PATH',
@@ -48,6 +65,11 @@ def doc_ingestion_pipeline():
             'COLLECTIONS_GIT_REPO_BRANCH': 'COLLECTIONS_GIT_REPO_BRANCH'
         },
     )
+    kubernetes.mount_pvc(
+        doc_ingestion_task,
+        pvc_name=ingestion_state_pvc_name,
+        mount_path=ingestion_state_mount_path,
+    )
     
 if __name__ == '__main__':
         
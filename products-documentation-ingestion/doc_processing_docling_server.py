@@ -1,12 +1,18 @@
 import requests
 from dotenv import load_dotenv
 import os
+from urllib.parse import urlsplit
 import md_splitter
 from langchain_core.documents import Document
 
 load_dotenv()
 
 
+def upstream_host():
+    # The Docling server fetches and converts the documents
+    return urlsplit(os.getenv("DOCLING_API_URL", "")).netloc
+
+
 def docling_processing(url):
     # Process the given URL using the Docling API
     api_address = os.getenv("DOCLING_API_URL")
@@ -24,12 +30,13 @@ def docling_processing(url):
     return md_content
 
 
-def generate_splits(urls, product, product_full_name, chunk_size, chunk_overlap):
-    # Generate splits from the given URLs
-    all_splits = []
+def iter_splits(urls, product, product_full_name, chunk_size, chunk_overlap, progress=None):
+    # Generate splits from the given URLs, one document at a time
     for url in urls:
         print(f"Processing: {url}")
         md_content = docling_processing(url)
+        if progress is not None:
+            progress.add("pages_fetched")
         # Get the title of the document from the last part of the URL
         title = url.split("/")[-1]
         # Add metadata
@@ -43,7 +50,14 @@ def generate_splits(urls, product, product_full_name, chunk_size, chunk_overlap)
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
         )
-        all_splits.extend(splits)
+        if progress is not None:
+            progress.add("pages_split")
+        yield from splits
+
+
+def generate_splits(urls, product, product_full_name, chunk_size, chunk_overlap):
+    # Generate splits from the given URLs
+    all_splits = list(iter_splits(urls, product, product_full_name, chunk_size, chunk_overlap))
     print(f"Generated {len(all_splits)} splits.")
 
-    return all_splits
\ No newline at end of file
+    return all_splits
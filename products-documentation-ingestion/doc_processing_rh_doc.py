@@ -1,109 +1,138 @@
-from typing import List
-
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import random
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
+
+import aiohttp
 from bs4 import BeautifulSoup
+from dotenv import load_dotenv
 from langchain_community.document_loaders.web_base import WebBaseLoader
 from langchain_community.document_transformers import Html2TextTransformer
 from langchain_core.documents import Document
 
+import html_markdown
 import md_splitter
 
+load_dotenv()
 
-class RedHatDocumentationLoader(WebBaseLoader):
-    """Load `Red Hat Documentation` single-html webpages."""
 
-    def load(self) -> List[Document]:
-        """Load webpages as Documents."""
-        soup = self.scrape()
-        title = soup.select_one("h1", {"class": "title"}).text  # Get title
+def retryable(status):
+    """HTTP statuses worth retrying, rate limits and server errors, the others fail the page at once"""
+    return status == 429 or status >= 500
 
-        # Get main content
-        book = soup.select_one(".book")
-        if book:
-            soup = book
-        else:
-            article = soup.select_one(".article")
-            if article:
-                soup = article
-            else:
-                soup = None
-
-        if soup is not None:
-            # Remove unwanted sections
-            unwanted_classes = [
-                "producttitle",
-                "subtitle",
-                "abstract",
-                "legalnotice",
-                "calloutlist",
-                "callout",
-            ]
-            for unwanted_class in unwanted_classes:
-                for div in soup.find_all("div", {"class": unwanted_class}):
-                    div.decompose()
-                for span in soup.find_all("span", {"class": unwanted_class}):
-                    span.decompose()
-                for header in soup.find_all("h2", {"class": unwanted_class}):
-                    header.decompose()
-            for hr in soup.find_all("hr"):
-                hr.decompose()
-
-            # Find and delete anchor tag with content "Legal Notice"
-            for anchor in soup.find_all("a"):
-                if anchor.text == "Legal Notice":
-                    anchor.decompose()
-
-            # Unwrap unwanted tags
-            unwrap_tags = ["div", "span", "strong", "section"]
-            for tag in unwrap_tags:
-                for match in soup.findAll(tag):
-                    match.unwrap()
-
-            # Transform description titles
-            for dt in soup.find_all("dt"):
-                if dt.string:
-                    dt.string.replace_with(f"-> {dt.string}")
-
-            # Transform code blocks
-            for code in soup.find_all("pre", {"class": "programlisting"}):
-                try:
-                    content = code.text
-                    code.clear()
-                    if "language-yaml" in code["class"]:
-                        code.string = f"```yaml\n{content}\n```"
-                    elif "language-json" in code["class"]:
-                        code.string = f"```json\n{content}\n```"
-                    elif "language-bash" in code["class"]:
-                        code.string = f"```bash\n{content}\n```"
-                    elif "language-python" in code["class"]:
-                        code.string = f"```python\n{content}\n```"
-                    elif "language-none" in code["class"]:
-                        code.string = f"```\n{content}\n```"
-                    else:
-                        code.string = f"```\n{content}\n```"
-                except Exception as e:
-                    print(f"Error processing code block: {e}")
-            for code in soup.find_all("pre", {"class": "screen"}):
-                try:
-                    content = code.text
-                    code.clear()
-                    code.string = f"```console\n{content}\n```"
-                except Exception as e:
-                    print(f"Error processing code block: {e}")
-
-            # Remove all attributes
-            for tag in soup():
-                tag.attrs.clear()
-
-            text = str(soup)  # Convert to string
-            text = text.replace("\xa0", " ")  # Replace non-breaking space
 
-        else:
-            text = ""
+def docs_base_url():
+    # Configurable so the ingestion can run against a local server of saved pages
+    return os.getenv("RH_DOCS_BASE_URL", "https://docs.redhat.com").rstrip("/")
+
+
+def docs_index_url():
+    return os.getenv("RH_DOCS_INDEX_URL", "https://access.redhat.com/documentation").rstrip("/")
 
-        # Add metadata
-        metadata = {"source": self.web_path, "title": title}
 
-        return [Document(page_content=text, metadata=metadata)]
+def upstream_host():
+    """Host the pages are fetched from, for the per-host limits of the ingestion"""
+    return urlsplit(docs_base_url()).netloc
+
+
+def parse_page(soup, source) -> Document:
+    """Clean a Red Hat documentation page and keep its main content as HTML."""
+    title = soup.select_one("h1", {"class": "title"}).text  # Get title
+
+    # Get main content
+    book = soup.select_one(".book")
+    if book:
+        soup = book
+    else:
+        article = soup.select_one(".article")
+        if article:
+            soup = article
+        else:
+            soup = None
+
+    if soup is not None:
+        # Remove unwanted sections
+        unwanted_classes = [
+            "producttitle",
+            "subtitle",
+            "abstract",
+            "legalnotice",
+            "calloutlist",
+            "callout",
+        ]
+        for unwanted_class in unwanted_classes:
+            for div in soup.find_all("div", {"class": unwanted_class}):
+                div.decompose()
+            for span in soup.find_all("span", {"class": unwanted_class}):
+                span.decompose()
+            for header in soup.find_all("h2", {"class": unwanted_class}):
+                header.decompose()
+        for hr in soup.find_all("hr"):
+            hr.decompose()
+
+        # Find and delete anchor tag with content "Legal Notice"
+        for anchor in soup.find_all("a"):
+            if anchor.text == "Legal Notice":
+                anchor.decompose()
+
+        # Unwrap unwanted tags
+        unwrap_tags = ["div", "span", "strong", "section"]
+        for tag in unwrap_tags:
+            for match in soup.findAll(tag):
+                match.unwrap()
+
+        # Transform description titles
+        for dt in soup.find_all("dt"):
+            if dt.string:
+                dt.string.replace_with(f"-> {dt.string}")
+
+        # Transform code blocks
+        for code in soup.find_all("pre", {"class": "programlisting"}):
+            try:
+                content = code.text
+                code.clear()
+                if "language-yaml" in code["class"]:
+                    code.string = f"```yaml\n{content}\n```"
+                elif "language-json" in code["class"]:
+                    code.string = f"```json\n{content}\n```"
+                elif "language-bash" in code["class"]:
+                    code.string = f"```bash\n{content}\n```"
+                elif "language-python" in code["class"]:
+                    code.string = f"```python\n{content}\n```"
+                elif "language-none" in code["class"]:
+                    code.string = f"```\n{content}\n```"
+                else:
+                    code.string = f"```\n{content}\n```"
+            except Exception as e:
+                print(f"Error processing code block: {e}")
+        for code in soup.find_all("pre", {"class": "screen"}):
+            try:
+                content = code.text
+                code.clear()
+                code.string = f"```console\n{content}\n```"
+            except Exception as e:
+                print(f"Error processing code block: {e}")
+
+        # Remove all attributes
+        for tag in soup():
+            tag.attrs.clear()
+
+        text = str(soup)  # Convert to string
+        text = text.replace("\xa0", " ")  # Replace non-breaking space
+
+    else:
+        text = ""
+
+    # Add metadata
+    metadata = {"source": source, "title": title}
+
+    return Document(page_content=text, metadata=metadata)
 
 
 def get_pages(product, version, language):
@@ -111,7 +140,8 @@ def get_pages(product, version, language):
 
     # Load the Red Hat documentation page
     url = [
-        "https://access.redhat.com/documentation/"
+        docs_index_url()
+        + "/"
         + language
         + "/"
         + product
@@ -143,36 +173,240 @@ def get_pages(product, version, language):
     return pages
 
 
-def split_document(product, version, language, page, product_full_name, chunk_size, chunk_overlap):
-    """Split a Red Hat documentation page into smaller sections."""
-
-    # Load, parse, and transform to Markdown
-    document_url = ["https://docs.redhat.com" + page]
-    print(f"Processing: {document_url}")
-    loader = RedHatDocumentationLoader(document_url)
-    docs = loader.load()
-    html2text = Html2TextTransformer()
-    md_docs = html2text.transform_documents(docs)
-
-    splits = md_splitter.split(md_docs, product, product_full_name, version=version, language=language, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-
-    return splits
-
-
-def generate_splits(product, product_full_name, version, language, chunk_size, chunk_overlap):
-    """Generate the splits for a Red Hat documentation product."""
+def split_html(html, source, product, version, language, product_full_name, chunk_size, chunk_overlap, converter="html2text"):
+    """Parse, transform to Markdown and split a fetched page, runs in a worker process."""
+    if converter == "lxml":
+        # Single pass over the page, straight to Markdown
+        md_docs = [html_markdown.html_to_markdown(html, source)]
+    else:
+        # Same parser as WebBaseLoader.scrape
+        docs = [parse_page(BeautifulSoup(html, "html.parser"), source)]
+        html2text = Html2TextTransformer()
+        md_docs = html2text.transform_documents(docs)
+
+    return md_splitter.split(md_docs, product, product_full_name, version=version, language=language, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+async def fetch_page(session, url, host_limits, retries=3, backoff=1.0, validators=None):
+    """
+    Fetch a page, retrying with exponential backoff and jitter on transient errors.
+
+    With the ETag and Last-Modified of a previous fetch as validators, the request is
+    conditional and the HTML is None if the page didn't change.
+    Returns the HTML and the validators of the page.
+    """
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    host_limit = host_limits[urlsplit(url).netloc]
+    for attempt in range(retries + 1):
+        try:
+            async with host_limit:
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304:
+                        return None, validators
+                    if not retryable(response.status):
+                        response.raise_for_status()
+                        return await response.text(), {
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                        }
+                    retry_after = response.headers.get("Retry-After")
+                    error = f"HTTP {response.status}"
+        # A payload error is a body cut short by the server or the network
+        except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+            retry_after = None
+            error = repr(e)
+        if attempt == retries:
+            raise RuntimeError(f"Failed to fetch {url} after {retries + 1} attempts: {error}")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2**attempt
+        print(f"Retrying {url} in {delay:.1f}s ({error})")
+        await asyncio.sleep(delay + random.uniform(0, backoff))
+
+
+_split_pool = None
+_split_pool_lock = threading.Lock()
+
+
+def split_pool():
+    """Worker processes splitting the pages, shared by all the versions ingested at the same time"""
+    global _split_pool
+    with _split_pool_lock:
+        if _split_pool is None:
+            workers = int(os.getenv("RH_DOCS_SPLIT_WORKERS", "0")) or os.cpu_count()
+            # Spawned, not forked: the ingestion threads hold gRPC channels and event loops
+            _split_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _split_pool
+
+
+def _discard_split_pool(pool):
+    """Replace a pool broken by a dead worker, at the next split_pool() call"""
+    global _split_pool
+    with _split_pool_lock:
+        if _split_pool is pool:
+            _split_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _put(results, item, stop):
+    """Put an item in the bounded buffer, unless the consumer stopped"""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+async def _produce_splits(pages, product, product_full_name, version, language, chunk_size, chunk_overlap, validators, unchanged, progress, results, stop, cache=None):
+    concurrency_per_host = int(os.getenv("RH_DOCS_CONCURRENCY_PER_HOST", "8"))
+    retries = int(os.getenv("RH_DOCS_FETCH_RETRIES", "3"))
+    timeout = float(os.getenv("RH_DOCS_FETCH_TIMEOUT", "120"))
+    converter = os.getenv("RH_DOCS_HTML_CONVERTER", "html2text")
+    # Pages being fetched or split ahead of the consumer
+    window = int(os.getenv("RH_DOCS_PAGE_BUFFER", "16"))
+
+    loop = asyncio.get_running_loop()
+    host_limits = {}
+    urls = [docs_base_url() + page for page in pages]
+    for url in urls:
+        host_limits.setdefault(urlsplit(url).netloc, asyncio.Semaphore(concurrency_per_host))
+
+    # Everything the splits of a page depend on, besides its content
+    split_params = json.dumps([product, product_full_name, version, language, chunk_size, chunk_overlap, converter])
+
+    async def process(session, pool, url):
+        cached = await loop.run_in_executor(None, cache.page, url) if cache is not None else None
+        page_validators = validators.get(url)
+        # Without validators of the last ingestion, the cached page is revalidated instead
+        html, validators[url] = await fetch_page(
+            session, url, host_limits, retries=retries,
+            validators=page_validators or (cached["validators"] if cached else None)
+        )
+        if html is None and page_validators:
+            print(f"Unchanged: {url}")
+            unchanged.add(url)
+            if progress is not None:
+                progress.add("pages_unchanged")
+            return []
+        if html is None:
+            html, content_hash = cached["html"], cached["content_hash"]
+            if progress is not None:
+                progress.add("pages_cached")
+        else:
+            if progress is not None:
+                progress.add("pages_fetched")
+            content_hash = None
+            if cache is not None:
+                content_hash = await loop.run_in_executor(None, cache.put_page, url, html, validators[url])
+        if cache is not None:
+            splits = await loop.run_in_executor(None, cache.splits, url, content_hash, split_params)
+            if splits is not None:
+                return splits
+        print(f"Processing: {url}")
+        try:
+            splits = await loop.run_in_executor(
+                pool, split_html, html, url, product, version, language, product_full_name, chunk_size, chunk_overlap, converter
+            )
+        except BrokenProcessPool:
+            _discard_split_pool(pool)
+            raise
+        if cache is not None:
+            await loop.run_in_executor(None, cache.put_splits, url, content_hash, split_params, splits)
+        if progress is not None:
+            progress.add("pages_split")
+        return splits
+
+    # One session, so connections are reused across pages; fetching and splitting overlap
+    connector = aiohttp.TCPConnector(limit=concurrency_per_host * len(host_limits))
+    async with aiohttp.ClientSession(
+        connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as session:
+        pool = split_pool()
+        tasks = []
+        try:
+            # A sliding window of pages is processed concurrently, the pages are handed
+            # over in order, so the output doesn't depend on the completion order
+            for index in range(len(urls)):
+                while len(tasks) < min(len(urls), index + window):
+                    tasks.append(asyncio.create_task(process(session, pool, urls[len(tasks)])))
+                splits = await tasks[index]
+                tasks[index] = None
+                if not await loop.run_in_executor(None, _put, results, splits, stop):
+                    break
+        finally:
+            # A failed page fails the version, the other pages are abandoned
+            pending = [task for task in tasks if task is not None and not task.done()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+def iter_splits(product, product_full_name, version, language, chunk_size, chunk_overlap, validators=None, unchanged=None, progress=None, cache=None):
+    """
+    Generate the splits of a Red Hat documentation product, page by page.
+
+    Pages are fetched concurrently and split in shared worker processes, in a background thread,
+    a bounded number of pages ahead of the consumer, so memory doesn't grow with the
+    size of the product.
+
+    `validators` maps page URLs to the ETag and Last-Modified of their last fetch: these
+    pages are fetched conditionally, and the URLs of the unchanged ones are added to
+    `unchanged` instead of being split. It is updated with the validators of all the pages.
+
+    With a `cache` (an IngestionWorkLog), the other pages are revalidated against their
+    cached HTML instead of being downloaded again, and the splits of a page already split
+    with the same content and parameters are reused.
+    """
+    validators = {} if validators is None else validators
+    unchanged = set() if unchanged is None else unchanged
 
     # Find all the pages.
     pages = get_pages(product, version, language)
     print(f"Found {len(pages)} pages:")
     print(pages)
 
-    # Generate the splits.
     print("Generating splits for Red Hat doc...")
-    all_splits = []
-    for page in pages:
-        splits = split_document(product, version, language, page, product_full_name, chunk_size, chunk_overlap)
-        all_splits.extend(splits)
+    results = queue.Queue(maxsize=int(os.getenv("RH_DOCS_PAGE_BUFFER", "16")))
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            asyncio.run(_produce_splits(
+                pages, product, product_full_name, version, language, chunk_size, chunk_overlap,
+                validators, unchanged, progress, results, stop, cache
+            ))
+        except BaseException as e:
+            _put(results, e, stop)
+        else:
+            _put(results, done, stop)
+
+    # Own thread and event loop, so it also works when called from a running loop
+    producer = threading.Thread(target=produce, name=f"rh-doc-{product}-{version}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield from item
+    finally:
+        # Lets the producer wind down if the consumer stopped early
+        stop.set()
+    producer.join()
+
+
+def generate_splits(product, product_full_name, version, language, chunk_size, chunk_overlap, validators=None, unchanged=None):
+    """Generate the splits for a Red Hat documentation product, see iter_splits."""
+    all_splits = list(iter_splits(
+        product, product_full_name, version, language, chunk_size, chunk_overlap, validators, unchanged
+    ))
     print(f"Generated {len(all_splits)} splits.")
 
-    return all_splits
\ No newline at end of file
+    return all_splits
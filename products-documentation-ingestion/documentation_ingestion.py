@@ -10,12 +10,13 @@ def doc_ingest():
     Start ingesting the docs
     """
 
+    import functools
     import os
 
     from dotenv import load_dotenv
-    import traceback
 
     import collections_loader as cl
+    import ingestion_scheduler
     import milvus_handler
 
     load_dotenv()
@@ -48,6 +49,14 @@ def doc_ingest():
     embeddings_api_url = os.getenv("EMBEDDINGS_API_URL")
     embeddings_api_key = os.getenv("EMBEDDINGS_API_KEY")
     embeddings_model_name = os.getenv("EMBEDDINGS_MODEL_NAME")
+    hybrid_search = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+    collection_layout = os.getenv("COLLECTION_LAYOUT", "per_version")
+    incremental_ingestion = os.getenv("INCREMENTAL_INGESTION", "true").lower() == "true"
+    ingestion_manifest_path = os.getenv("INGESTION_MANIFEST_PATH")
+    bulk_load = os.getenv("BULK_LOAD", "false").lower() == "true"
+    ingestion_worklog_path = os.getenv("INGESTION_WORKLOG_PATH")
+    blue_green = os.getenv("BLUE_GREEN", "true").lower() == "true"
+    blue_green_keep = int(os.getenv("BLUE_GREEN_KEEP", "2"))
 
     milvus_handler = milvus_handler.MilvusHandler(
         milvus_uri,
@@ -57,79 +66,84 @@ def doc_ingest():
         milvus_batch_size,
         embeddings_api_url,
         embeddings_api_key,
-        embeddings_model_name
+        embeddings_model_name,
+        hybrid_search,
+        collection_layout,
+        ingestion_manifest_path,
+        bulk_load,
+        ingestion_worklog_path,
+        blue_green,
+        blue_green_keep
     )
 
 
+    ingestion_concurrency = int(os.getenv("INGESTION_CONCURRENCY", "4"))
+    ingestion_concurrency_per_host = int(os.getenv("INGESTION_CONCURRENCY_PER_HOST", "2"))
+
     # At the start of processing, log total counts
     print(f"\n==== STARTING DOCUMENT PROCESSING ====")
     print(f"Found {len(collections)} collections to process")
     total_versions = sum(len(collection.versions) for collection in collections)
-    print(f"Total document versions to process: {total_versions}\n")
-
-    # Counter for progress tracking
-    processed_count = 0
-
+    print(f"Total document versions to process: {total_versions}")
+    print(f"Processing up to {ingestion_concurrency} versions at a time, {ingestion_concurrency_per_host} per upstream host\n")
+
+    def create_or_keep(collection, version):
+        if milvus_handler.version_interrupted(collection, version):
+            print(f'▶️ "{collection.collection_full_name}" at version {version.version_number} was interrupted, resuming it')
+        elif milvus_handler.version_check(collection, version):
+            print(f'⏭️ "{collection.collection_full_name}" at version {version.version_number} already present, skipping')
+            return "skipped", {}
+        else:
+            print(f'▶️ Creating "{collection.collection_full_name}" at version {version.version_number}')
+        counters = milvus_handler.ingest_documentation(collection, version, chunk_size, chunk_overlap)
+        print(f'✅ Successfully created "{collection.collection_full_name}" at version {version.version_number}')
+        return "created", counters
+
+    def update(collection, version):
+        if incremental_ingestion:
+            print(f'🔄 Updating "{collection.collection_full_name}" at version {version.version_number} with the new or changed content only')
+        else:
+            print(f'🔄 Creating/replacing "{collection.collection_full_name}" at version {version.version_number}, no check needed')
+        counters = milvus_handler.ingest_documentation(
+            collection, version, chunk_size, chunk_overlap, incremental=incremental_ingestion
+        )
+        print(f'✅ Successfully updated "{collection.collection_full_name}" at version {version.version_number}')
+        return "updated", counters
+
+    def delete(collection, version):
+        if not milvus_handler.version_check(collection, version):
+            print(f'⏭️ No "{collection.collection_full_name}" at version {version.version_number} present already, skipping')
+            return "skipped", {}
+        print(f'🗑️ Deleting "{collection.collection_full_name}" at version {version.version_number}')
+        milvus_handler.version_delete(collection, version)
+        print(f'✅ Successfully deleted "{collection.collection_full_name}" at version {version.version_number}')
+        return "deleted", {}
+
+    actions = {"create_or_keep": create_or_keep, "update": update, "delete": delete}
+
+    units = []
     for collection in collections:
-        print(f"\n📚 COLLECTION: {collection.collection_full_name}")
-        print(f"Base name: {collection.collection_base_name}")
-        print(f"Contains {len(collection.versions)} version(s)")
-        
+        print(f"📚 COLLECTION: {collection.collection_full_name} ({collection.collection_base_name}), {len(collection.versions)} version(s)")
         for version in collection.versions:
-            processed_count += 1
-            progress = (processed_count / total_versions) * 100
-            
-            print('\n' + '=' * 80)
-            print(f"⏳ PROCESSING [{processed_count}/{total_versions}] ({progress:.1f}%)")
-            print(f"Collection: \"{collection.collection_full_name}\"")
-            print(f"Version: \"{version.version_number}\"")
-            print(f"Directive: \"{version.store_directive}\"")
-            
-            collection_name = (
-                f"{collection.collection_base_name}_{version.version_number}"
-                .replace("-", "_")
-                .replace(".", "_")
+            action = actions.get(version.store_directive)
+            if action is None:
+                print(f'⏭️ Unknown directive "{version.store_directive}" for version {version.version_number}, skipping')
+                continue
+            units.append(
+                ingestion_scheduler.IngestionUnit(
+                    name=f"{collection.collection_full_name} {version.version_number}",
+                    directive=version.store_directive,
+                    action=functools.partial(action, collection, version),
+                    hosts=milvus_handler.upstream_hosts(collection, version) if action is not delete else (),
+                    # The versions of a partitioned collection share its Milvus collection
+                    key=milvus_handler.get_collection_name(collection, version),
+                )
             )
-            
-            # If you have URLs to process, show them clearly
-            if hasattr(version, 'urls') and version.urls:
-                print("\nProcessing URLs:")
-                for idx, url in enumerate(version.urls, 1):
-                    print(f"  {idx}. {url}")
-            
-            if (version.store_directive == 'create_or_keep'):
-                if (milvus_handler.collection_check(collection_name) is None):
-                    print("\n▶️ Collection not present, creating it...")
-                    try:
-                        print(f'▶️ Creating "{collection.collection_full_name}" at version {version.version_number}')
-                        milvus_handler.ingest_documentation(collection, version, chunk_size, chunk_overlap)
-                        print("✅ Successfully created collection")
-                    except Exception as e:
-                        print(f'❌ Error processing "{collection.collection_full_name}" at version {version.version_number}')
-                        print(f'❌ {e}')
-                        traceback.print_exc()
-                else:
-                    print("\n⏭️ Collection already present, skipping")
-            elif (version.store_directive == 'update'):
-                print("\n🔄 No check needed, creating/replacing the collection anyway...")
-                try:
-                    print(f'🔄 Updating "{collection.collection_full_name}" at version {version.version_number}')
-                    milvus_handler.ingest_documentation(collection, version, chunk_size, chunk_overlap)
-                    print("✅ Successfully updated collection")
-                except Exception as e:
-                    print(f'❌ Error processing "{collection.collection_full_name}" at version {version.version_number}')
-                    print(f'❌ {e}')
-                    traceback.print_exc()
-            elif (version.store_directive == 'delete'):
-                if (milvus_handler.collection_check(collection_name) is None):
-                    print("\n⏭️ No collection present already, skipping")
-                else:
-                    print("\n🗑️ Let's delete it")
-                    milvus_handler.collection_delete(collection_name)
-                    print("✅ Successfully deleted collection")
-            
-            print(f"Completed processing [{processed_count}/{total_versions}]")
+
+    scheduler = ingestion_scheduler.IngestionScheduler(ingestion_concurrency, ingestion_concurrency_per_host)
+    scheduler.run(units)
 
     print("\n==== DOCUMENT PROCESSING COMPLETE ====")
-    print(f"Processed {processed_count} document versions across {len(collections)} collections")
-    print("Done!")
\ No newline at end of file
+    scheduler.summary(units)
+    print(f"Processed {len(units)} document versions across {len(collections)} collections")
+    print("Done!")
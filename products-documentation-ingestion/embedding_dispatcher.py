@@ -0,0 +1,201 @@
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List
+
+import requests
+from langchain_core.embeddings import Embeddings
+from requests.adapters import HTTPAdapter
+
+# Responses worth retrying after a pause, 413 is handled by splitting the batch instead
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class EmbeddingRequestError(Exception):
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class EmbeddingDispatcher(Embeddings):
+    """
+    Embeddings client keeping several requests in flight, with adaptive batch sizes.
+
+    The texts of an `embed_documents` call are cut into batches sent concurrently to a
+    HuggingFace-style inference endpoint. The batch size grows while requests answer
+    under the target latency, shrinks when they are slower, and halves on 413 (the
+    failed batch is split). On 429, the number of requests in flight is halved, and
+    grows back by one on every success. 429 and 5xx responses and connection errors
+    are retried with exponential backoff and jitter, honoring Retry-After. The
+    embeddings are returned in the order of the texts, whatever the completion order.
+
+    Args:
+        api_url (str): URL of the embeddings endpoint.
+        api_key (str): API key of the endpoint.
+        model_name (str): Name of the embeddings model.
+        concurrency (int): Maximum number of requests in flight.
+        batch_size (int): Initial number of texts per request.
+        min_batch_size (int): Smallest batch size.
+        max_batch_size (int): Largest batch size.
+        target_latency (float): Request latency the batch size adapts to, in seconds.
+        retries (int): Maximum number of retries of a batch.
+        backoff (float): Base delay of the retries, in seconds.
+        timeout (float): Timeout of a request, in seconds.
+
+    Methods:
+        embed_documents: Gets the embeddings of a list of texts.
+        embed_query: Gets the embedding of a text.
+        stats: Returns the request metrics.
+    """
+
+    def __init__(
+        self,
+        api_url,
+        api_key,
+        model_name,
+        concurrency=4,
+        batch_size=32,
+        min_batch_size=1,
+        max_batch_size=256,
+        target_latency=2.0,
+        retries=5,
+        backoff=1.0,
+        timeout=120.0,
+    ):
+        self.api_url = api_url
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self.inflight_limit = concurrency
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        # One keep-alive connection per request in flight
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embeddings")
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.split = 0
+
+    def _post(self, texts):
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                self.api_url,
+                json={"inputs": texts, "options": {"wait_for_model": True, "use_cache": True}},
+                timeout=self.timeout,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise EmbeddingRequestError(None, repr(e)) from e
+        if response.status_code == 413 or response.status_code in RETRY_STATUSES:
+            raise EmbeddingRequestError(
+                response.status_code,
+                f"HTTP {response.status_code}: {response.text[:200]}",
+                response.headers.get("Retry-After"),
+            )
+        response.raise_for_status()
+        embeddings = response.json()
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings, time.monotonic() - start
+
+    def _adapt(self, size, latency):
+        """Additive increase while under the target latency, multiplicative decrease above it"""
+        with self._lock:
+            if latency > self.target_latency:
+                self.batch_size = max(self.min_batch_size, int(self.batch_size * 0.7))
+            elif size >= self.batch_size:
+                self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 4))
+
+    def _retry_delay(self, error, attempt):
+        if error.retry_after and error.retry_after.isdigit():
+            delay = float(error.retry_after)
+        else:
+            delay = self.backoff * 2**attempt
+        return delay + random.uniform(0, self.backoff)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Get the embeddings of a list of texts, in the same order."""
+        results = [None] * len(texts)
+        # Slices of the texts still to send: (ready time, start, end, attempt)
+        todo = []
+        next_start = 0
+        in_flight = {}
+
+        while next_start < len(texts) or todo or in_flight:
+            now = time.monotonic()
+            while len(in_flight) < self.inflight_limit:
+                ready = [item for item in todo if item[0] <= now]
+                if ready:
+                    item = min(ready, key=lambda item: item[1])
+                    todo.remove(item)
+                    _, start, end, attempt = item
+                elif next_start < len(texts):
+                    start, end, attempt = next_start, min(len(texts), next_start + self.batch_size), 0
+                    next_start = end
+                else:
+                    break
+                future = self.executor.submit(self._post, texts[start:end])
+                in_flight[future] = (start, end, attempt)
+                with self._lock:
+                    self.requests += 1
+
+            timeout = None
+            if todo:
+                timeout = max(0.0, min(item[0] for item in todo) - time.monotonic())
+            if not in_flight:
+                time.sleep(timeout or 0)
+                continue
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, end, attempt = in_flight.pop(future)
+                try:
+                    embeddings, latency = future.result()
+                except EmbeddingRequestError as e:
+                    if e.status == 413 and end - start > 1:
+                        # Too large for the server: split the batch, and send smaller ones
+                        with self._lock:
+                            # Never grow back to the size the server refused
+                            self.max_batch_size = min(self.max_batch_size, end - start - 1)
+                            self.batch_size = max(self.min_batch_size, (end - start) // 2)
+                            self.split += 1
+                        middle = (start + end) // 2
+                        todo += [(0.0, start, middle, attempt), (0.0, middle, end, attempt)]
+                        continue
+                    if e.status == 413 or attempt >= self.retries:
+                        raise RuntimeError(f"Embedding request failed after {attempt + 1} attempt(s): {e}") from e
+                    if e.status == 429:
+                        # The server is saturated: fewer requests in flight
+                        self.inflight_limit = max(1, self.inflight_limit // 2)
+                    with self._lock:
+                        self.retried += 1
+                    todo.append((time.monotonic() + self._retry_delay(e, attempt), start, end, attempt + 1))
+                    continue
+                results[start:end] = embeddings
+                self.inflight_limit = min(self.concurrency, self.inflight_limit + 1)
+                self._adapt(end - start, latency)
+        return results
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        """Returns the request metrics."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retried": self.retried,
+                "split": self.split,
+                "batch_size": self.batch_size,
+                "inflight_limit": self.inflight_limit,
+            }
@@ -0,0 +1,70 @@
+"""Stub of the embeddings endpoint, to try the ingestion and the embedding dispatcher locally
+
+Answers HuggingFace-style {"inputs": [...]} requests with deterministic pseudo-embeddings.
+It can simulate a GPU server: latency growing with the batch size, 413 above a maximum
+batch size and 429 on a share of the requests.
+
+Usage:
+    python embedding_stub_server.py [--port 8080] [--dim 768] [--latency 0.05] [--per-text 0.005]
+        [--max-batch 64] [--rate-limit 0.1]
+    EMBEDDINGS_API_URL=http://localhost:8080 python ...
+"""
+import argparse
+import hashlib
+import json
+import random
+import struct
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def embed(text, dim):
+    """Deterministic pseudo-embedding of a text"""
+    values = []
+    seed = text.encode("utf-8")
+    while len(values) < dim:
+        seed = hashlib.sha256(seed).digest()
+        values.extend(value / 2**31 for value in struct.unpack("<8i", seed))
+    return values[:dim]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub embeddings endpoint")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fixed latency of a request, in seconds")
+    parser.add_argument("--per-text", type=float, default=0.005, help="Added latency per text, in seconds")
+    parser.add_argument("--max-batch", type=int, default=0, help="Answer 413 above this batch size, 0 for no limit")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Share of the requests answered with 429")
+    args = parser.parse_args()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            pass
+
+        def answer(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["inputs"]
+            if args.max_batch and len(texts) > args.max_batch:
+                self.answer(413, {"error": f"Batch of {len(texts)} above {args.max_batch}"})
+            elif random.random() < args.rate_limit:
+                self.answer(429, {"error": "Rate limited"}, {"Retry-After": "1"})
+            else:
+                time.sleep(args.latency + args.per_text * len(texts))
+                self.answer(200, [embed(text, args.dim) for text in texts])
+
+    print(f"Stub embeddings endpoint on http://localhost:{args.port}")
+    ThreadingHTTPServer(("", args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
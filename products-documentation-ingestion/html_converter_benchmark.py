@@ -0,0 +1,106 @@
+"""Benchmark and parity check of the lxml Markdown converter against the current loader
+
+Converts every saved page of a corpus with both paths, BeautifulSoup cleanup followed by
+Html2TextTransformer, and html_markdown.html_to_markdown, and reports their timings and
+how close their outputs are:
+- headers: whether both outputs have the same Markdown headers, which drive the splits
+- similarity: similarity of the word sequences, ignoring line wrapping and Markdown escapes
+
+Usage:
+    python html_converter_benchmark.py <saved_pages_dir> [--runs 3] [--min-similarity 0.97] [--show-diff]
+
+Exits with status 1 if a page is under the similarity threshold or has different headers.
+"""
+import argparse
+import difflib
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+from langchain_community.document_transformers import Html2TextTransformer
+
+import html_markdown
+from doc_processing_rh_doc import parse_page
+
+_ESCAPE = re.compile(r"\\([\\`*_{}\[\]()#+\-.!|>])")
+
+
+def convert_html2text(html, source):
+    docs = [parse_page(BeautifulSoup(html, "html.parser"), source)]
+    return Html2TextTransformer().transform_documents(docs)[0].page_content
+
+
+def convert_lxml(html, source):
+    return html_markdown.html_to_markdown(html, source).page_content
+
+
+def best_time(convert, html, source, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = convert(html, source)
+        timings.append(time.perf_counter() - start)
+    return min(timings), output
+
+
+def headers(markdown):
+    return [" ".join(line.split()) for line in markdown.splitlines() if line.startswith("#")]
+
+
+def words(markdown):
+    return _ESCAPE.sub(r"\1", markdown).split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lxml converter benchmark and parity check")
+    parser.add_argument("corpus", help="Directory of saved .html pages")
+    parser.add_argument("--runs", type=int, default=3, help="Conversions per page, the best time is kept")
+    parser.add_argument("--min-similarity", type=float, default=0.97)
+    parser.add_argument("--show-diff", action="store_true", help="Print the diff of the failing pages")
+    args = parser.parse_args()
+
+    pages = sorted(
+        os.path.join(root, file)
+        for root, _, files in os.walk(args.corpus)
+        for file in files
+        if file.endswith(".html")
+    )
+    if not pages:
+        raise SystemExit(f"No .html page in {args.corpus}")
+
+    total_current, total_lxml, failures = 0.0, 0.0, 0
+    print(f"{'page':<60} {'html2text ms':>12} {'lxml ms':>9} {'speedup':>8} {'headers':>8} {'similarity':>10}")
+    for path in pages:
+        with open(path, "r", encoding="utf-8") as file:
+            html = file.read()
+        current_time, current = best_time(convert_html2text, html, path, args.runs)
+        lxml_time, converted = best_time(convert_lxml, html, path, args.runs)
+        total_current += current_time
+        total_lxml += lxml_time
+
+        same_headers = headers(current) == headers(converted)
+        similarity = difflib.SequenceMatcher(None, words(current), words(converted), autojunk=False).ratio()
+        failed = not same_headers or similarity < args.min_similarity
+        failures += failed
+        print(
+            f"{os.path.relpath(path, args.corpus)[-60:]:<60} {current_time * 1000:12.1f} {lxml_time * 1000:9.1f} "
+            f"{current_time / lxml_time:7.1f}x {'same' if same_headers else 'DIFF':>8} {similarity:10.3f}"
+        )
+        if failed and args.show_diff:
+            sys.stdout.writelines(
+                difflib.unified_diff(
+                    current.splitlines(keepends=True), converted.splitlines(keepends=True), "html2text", "lxml", n=1
+                )
+            )
+
+    print(
+        f"\n{len(pages)} pages: html2text {total_current:.2f}s, lxml {total_lxml:.2f}s, "
+        f"speedup {total_current / total_lxml:.1f}x, {failures} page(s) out of parity"
+    )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
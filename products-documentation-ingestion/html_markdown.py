@@ -0,0 +1,229 @@
+"""Single-pass conversion of Red Hat documentation pages to Markdown with lxml
+
+Does the same cleanup as `doc_processing_rh_doc.parse_page` followed by
+`Html2TextTransformer`, in one traversal of the lxml tree, writing Markdown directly
+instead of serializing the cleaned HTML and parsing it again.
+"""
+import re
+
+from langchain_core.documents import Document
+from lxml import html as lxml_html
+
+# Sections removed from the pages, on div, span and h2 elements
+UNWANTED_CLASSES = {"producttitle", "subtitle", "abstract", "legalnotice", "calloutlist", "callout"}
+UNWANTED_TAGS = {"div", "span", "h2"}
+
+# Elements whose content is dropped
+SKIPPED_TAGS = {"head", "script", "style", "img", "hr", "noscript", "template"}
+
+# Elements unwrapped by the HTML cleanup
+UNWRAPPED_TAGS = {"div", "span", "strong", "section"}
+
+BLOCK_TAGS = {"p", "blockquote", "dl", "dt", "dd", "figure", "figcaption", "table", "ul", "ol", "pre"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+
+CODE_LANGUAGES = ["yaml", "json", "bash", "python"]
+
+_WHITESPACE = re.compile(r"[ \t\r\n\f\v\xa0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _classes(element):
+    return element.get("class", "").split()
+
+
+def _main_content(root):
+    """The .book element of the page, else its .article element"""
+    for class_name in ("book", "article"):
+        found = root.xpath(
+            f'(//*[contains(concat(" ", normalize-space(@class), " "), " {class_name} ")])[1]'
+        )
+        if found:
+            return found[0]
+    return None
+
+
+def _nodes(element):
+    """Child text and element nodes of an element, once UNWRAPPED_TAGS are unwrapped"""
+    if element.text:
+        yield element.text
+    for child in element:
+        if isinstance(child.tag, str) and child.tag.lower() in UNWRAPPED_TAGS:
+            yield from _nodes(child)
+        else:
+            yield child
+        if child.tail:
+            yield child.tail
+
+
+def _has_single_string(element):
+    """Whether BeautifulSoup's `.string` of the element would be set"""
+    nodes = list(_nodes(element))
+    if len(nodes) != 1:
+        return False
+    return isinstance(nodes[0], str) or _has_single_string(nodes[0])
+
+
+def _code_block(element):
+    content = element.text_content()
+    classes = _classes(element)
+    if "screen" in classes and "programlisting" not in classes:
+        language = "console"
+    else:
+        language = next((name for name in CODE_LANGUAGES if f"language-{name}" in classes), "")
+    return f"```{language}\n{content}\n```"
+
+
+class _MarkdownWriter:
+    """Writes the Markdown of an element tree, in a single depth-first traversal."""
+
+    def __init__(self):
+        self.blocks = []
+        self.inline = []
+        self.list_depth = 0
+        self.prefix_next_text = None
+
+    def flush(self, prefix=""):
+        text = _WHITESPACE.sub(" ", "".join(self.inline)).strip()
+        self.inline = []
+        if text:
+            self.blocks.append(prefix + text)
+
+    def text(self, value):
+        if value:
+            if self.prefix_next_text:
+                value = self.prefix_next_text + value
+                self.prefix_next_text = None
+            self.inline.append(value)
+
+    def children(self, element):
+        self.text(element.text)
+        for child in element:
+            self.element(child)
+            self.text(child.tail)
+
+    def inline_wrapped(self, element, marker):
+        start = len(self.inline)
+        self.children(element)
+        content = "".join(self.inline[start:]).strip()
+        del self.inline[start:]
+        if content:
+            self.inline.append(f"{marker}{content}{marker}")
+
+    def element(self, element):
+        tag = element.tag
+        if not isinstance(tag, str):
+            # Comments and processing instructions
+            return
+        tag = tag.lower()
+        if tag in SKIPPED_TAGS:
+            return
+        if tag in UNWANTED_TAGS and UNWANTED_CLASSES.intersection(_classes(element)):
+            return
+        if tag == "a" and element.text_content() == "Legal Notice":
+            return
+
+        if tag in HEADING_TAGS:
+            self.flush()
+            self.children(element)
+            self.flush("#" * HEADING_TAGS[tag] + " ")
+        elif tag == "pre":
+            self.flush()
+            if "programlisting" in _classes(element) or "screen" in _classes(element):
+                self.blocks.append(_code_block(element))
+            else:
+                self.blocks.append("\n".join("    " + line for line in element.text_content().split("\n")))
+        elif tag in ("ul", "ol"):
+            self.flush()
+            self.list_depth += 1
+            number = 0
+            for child in element:
+                if isinstance(child.tag, str) and child.tag.lower() == "li":
+                    number += 1
+                    bullet = f"{number}. " if tag == "ol" else "* "
+                    self.list_item(child, "  " * self.list_depth + bullet)
+                else:
+                    self.element(child)
+            self.list_depth -= 1
+        elif tag == "dt":
+            self.flush()
+            # Description titles made of a single string are marked, as in the HTML cleanup
+            if _has_single_string(element):
+                self.prefix_next_text = "-> "
+            self.children(element)
+            self.prefix_next_text = None
+            self.flush()
+        elif tag == "table":
+            self.flush()
+            self.table(element)
+        elif tag == "br":
+            self.inline.append("\n")
+            self.flush()
+        elif tag == "code":
+            self.inline_wrapped(element, "`")
+        elif tag in ("em", "i"):
+            self.inline_wrapped(element, "_")
+        elif tag == "b":
+            self.inline_wrapped(element, "**")
+        elif tag in BLOCK_TAGS:
+            self.flush()
+            self.children(element)
+            self.flush()
+        else:
+            # UNWRAPPED_TAGS, links and unknown inline elements
+            self.children(element)
+
+    def list_item(self, element, bullet):
+        start = len(self.blocks)
+        self.flush()
+        self.children(element)
+        self.flush()
+        if len(self.blocks) > start:
+            self.blocks[start] = bullet + self.blocks[start]
+        else:
+            self.blocks.append(bullet.rstrip())
+
+    def table(self, element):
+        rows = []
+        for row in element.iter("tr"):
+            cells = [
+                _WHITESPACE.sub(" ", cell.text_content()).strip()
+                for cell in row
+                if isinstance(cell.tag, str) and cell.tag.lower() in ("td", "th")
+            ]
+            rows.append("| ".join(cells))
+        if rows:
+            header_width = rows[0].count("| ") + 1
+            rows.insert(1, "|".join(["---"] * header_width))
+            self.blocks.append("\n".join(rows))
+
+    def markdown(self):
+        self.flush()
+        return _BLANK_LINES.sub("\n\n", "\n\n".join(self.blocks)).strip() + "\n"
+
+
+def html_to_markdown(html_text, source):
+    """
+    Convert a Red Hat documentation page to a Markdown document.
+
+    Args:
+        html_text (str): The HTML of the page.
+        source (str): The URL of the page.
+
+    Returns:
+        Document: The Markdown of the main content, with the source and title as metadata.
+    """
+    root = lxml_html.document_fromstring(html_text.encode("utf-8"), parser=lxml_html.HTMLParser(encoding="utf-8"))
+    h1 = root.find(".//h1")
+    # Same failure as the BeautifulSoup loader on a page without title
+    title = h1.text_content()
+
+    content = _main_content(root)
+    if content is None:
+        text = ""
+    else:
+        writer = _MarkdownWriter()
+        writer.element(content)
+        text = writer.markdown()
+
+    return Document(page_content=text, metadata={"source": source, "title": title})
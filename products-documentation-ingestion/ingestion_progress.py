@@ -0,0 +1,53 @@
+import threading
+import time
+
+# Stages of the ingestion pipeline, in order
+STAGES = [
+    "pages_fetched",
+    "pages_unchanged",
+    "pages_cached",
+    "pages_split",
+    "splits",
+    "splits_unchanged",
+    "embedded",
+    "embeddings_reused",
+    "staged",
+    "inserted",
+    "deleted",
+]
+
+
+class IngestionProgress:
+    """
+    Thread-safe counters of the ingestion stages, printed at most every `interval` seconds.
+
+    Args:
+        name (str): Name of the ingested collection and version, printed with the counters.
+        interval (float): Minimum time between two progress lines, in seconds.
+
+    Methods:
+        add: Adds to the counter of a stage.
+        report: Prints the counters.
+    """
+
+    def __init__(self, name, interval=30.0):
+        self.name = name
+        self.interval = interval
+        self.counters = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def add(self, stage, count=1):
+        with self._lock:
+            self.counters[stage] += count
+            due = time.monotonic() - self._last_report >= self.interval
+            if due:
+                self._last_report = time.monotonic()
+        if due:
+            self.report()
+
+    def report(self):
+        with self._lock:
+            counters = " ".join(f"{stage}={count}" for stage, count in self.counters.items())
+        print(f"📊 {self.name} [{time.monotonic() - self._start:.0f}s] {counters}")
@@ -0,0 +1,116 @@
+import time
+import traceback
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class IngestionUnit:
+    """
+    A (collection, version) to process, with what limits its concurrency.
+
+    Args:
+        name (str): Name of the unit in the logs and the summary.
+        directive (str): Store directive of the version.
+        action (callable): Processes the unit, returns its status and the counters of its stages.
+        hosts (set[str]): Upstream hosts the unit fetches from.
+        key (str): Units with the same key never run at the same time, e.g. the versions of a collection.
+    """
+
+    def __init__(self, name, directive, action, hosts=(), key=None):
+        self.name = name
+        self.directive = directive
+        self.action = action
+        self.hosts = set(hosts)
+        self.key = key
+        self.status = "pending"
+        self.counters = {}
+        self.duration = 0.0
+        self.error = None
+
+
+class IngestionScheduler:
+    """
+    Runs independent ingestion units concurrently.
+
+    A unit starts when a worker is free, none of its upstream hosts is at its limit, and
+    no unit with the same key is running. Units start in submission order, except when
+    the next ones are held back by their limits. A failing unit is reported and doesn't
+    stop the others.
+
+    Args:
+        max_workers (int): Units processed at the same time.
+        per_host (int): Units processed at the same time per upstream host.
+
+    Methods:
+        run: Processes units, returns them with their status, duration and counters.
+        summary: Prints a table of the processed units.
+    """
+
+    def __init__(self, max_workers=4, per_host=2):
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+
+    def _ready(self, unit, host_load, busy_keys):
+        if unit.key is not None and unit.key in busy_keys:
+            return False
+        return all(host_load[host] < self.per_host for host in unit.hosts)
+
+    def _process(self, unit):
+        start = time.monotonic()
+        try:
+            unit.status, unit.counters = unit.action()
+        except Exception as e:
+            unit.status = "failed"
+            unit.error = e
+            print(f'❌ Error processing {unit.name}')
+            print(f'❌ {e}')
+            traceback.print_exc()
+        unit.duration = time.monotonic() - start
+        return unit
+
+    def run(self, units):
+        """Process units, returns them in submission order."""
+        pending = list(units)
+        host_load = Counter()
+        busy_keys = set()
+        running = {}
+        completed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingestion") as executor:
+            while pending or running:
+                for unit in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    if not self._ready(unit, host_load, busy_keys):
+                        continue
+                    pending.remove(unit)
+                    host_load.update(unit.hosts)
+                    if unit.key is not None:
+                        busy_keys.add(unit.key)
+                    unit.status = "running"
+                    print(f"⏳ Starting {unit.name} ({unit.directive})")
+                    running[executor.submit(self._process, unit)] = unit
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    unit = running.pop(future)
+                    host_load.subtract(unit.hosts)
+                    busy_keys.discard(unit.key)
+                    completed += 1
+                    print(
+                        f"Completed [{completed}/{len(units)}] {unit.name}: {unit.status} in {unit.duration:.0f}s"
+                    )
+        return units
+
+    @staticmethod
+    def summary(units):
+        """Print the status, duration and chunk counts of every unit."""
+        width = max([len(unit.name) for unit in units] + [4])
+        print(f"\n{'unit':<{width}} {'directive':<14} {'status':<9} {'duration':>9} {'embedded':>9} {'inserted':>9} {'deleted':>8}")
+        for unit in units:
+            print(
+                f"{unit.name:<{width}} {unit.directive:<14} {unit.status:<9} {unit.duration:8.1f}s "
+                f"{unit.counters.get('embedded', 0):9d} {unit.counters.get('inserted', 0):9d} "
+                f"{unit.counters.get('deleted', 0):8d}"
+            )
+        statuses = Counter(unit.status for unit in units)
+        print(", ".join(f"{count} {status}" for status, count in sorted(statuses.items())))
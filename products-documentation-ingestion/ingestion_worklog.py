@@ -0,0 +1,229 @@
+import array
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from langchain_core.documents import Document
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    collection TEXT NOT NULL,
+    version TEXT NOT NULL,
+    status TEXT NOT NULL,
+    chunk_size INTEGER,
+    chunk_overlap INTEGER,
+    batches INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    generation TEXT,
+    PRIMARY KEY (collection, version)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    html BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS splits (
+    url TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    params TEXT NOT NULL,
+    splits BLOB NOT NULL,
+    PRIMARY KEY (url, content_hash, params)
+);
+CREATE TABLE IF NOT EXISTS embeddings (
+    collection TEXT NOT NULL,
+    version TEXT NOT NULL,
+    chunk_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    PRIMARY KEY (collection, version, chunk_hash)
+);
+"""
+
+
+def page_hash(html):
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value).encode("utf-8"))
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class IngestionWorkLog:
+    """
+    Work log of the ingestion in a SQLite file, so a run interrupted halfway can be resumed.
+
+    It keeps:
+    - the state of every collection version: in progress or complete, the chunk size
+      and overlap it was ingested with, and the generation a blue/green rebuild in
+      progress is built into
+    - the embeddings of the chunks of the versions in progress, so a resumed run doesn't
+      embed them again. They are dropped once the version is complete
+    - the last fetched HTML of every page, with its ETag and Last-Modified, so it is
+      fetched conditionally and not downloaded again while it doesn't change
+    - the splits of the pages, by page content and splitting parameters, so unchanged
+      pages are not converted and split again, and a new chunk size or overlap only
+      needs the cached HTML
+
+    Args:
+        path (str): Path of the SQLite file, on a persistent volume.
+
+    Methods:
+        start_unit: Marks a collection version in progress, returns its previous state.
+        set_generation: Records the generation a collection version is built into.
+        finish_unit: Marks a collection version complete.
+        unit_status: Returns the status of a collection version.
+        embeddings: Returns the stored embeddings of chunks of a version in progress.
+        add_embeddings: Stores the embeddings of a batch of chunks.
+        page: Returns the cached HTML and validators of a page.
+        put_page: Caches the HTML and validators of a page.
+        splits: Returns the cached splits of a page.
+        put_splits: Caches the splits of a page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Shared by the ingestion threads, one statement at a time
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        # Work logs written before blue/green rebuilds were resumed
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(units)")]
+        if "generation" not in columns:
+            self._connection.execute("ALTER TABLE units ADD COLUMN generation TEXT")
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def start_unit(self, collection, version, chunk_size, chunk_overlap):
+        """Mark a collection version in progress, returns its previous state or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, chunk_size, chunk_overlap, batches, generation FROM units "
+                "WHERE collection = ? AND version = ?",
+                (collection, version),
+            ).fetchone()
+            previous = None
+            if row is not None:
+                previous = dict(zip(("status", "chunk_size", "chunk_overlap", "batches", "generation"), row))
+            self._connection.execute(
+                "INSERT INTO units (collection, version, status, chunk_size, chunk_overlap, batches, updated_at) "
+                "VALUES (?, ?, 'in_progress', ?, ?, 0, ?) "
+                "ON CONFLICT (collection, version) DO UPDATE SET status = 'in_progress', "
+                "chunk_size = excluded.chunk_size, chunk_overlap = excluded.chunk_overlap, updated_at = excluded.updated_at",
+                (collection, version, chunk_size, chunk_overlap, time.time()),
+            )
+        return previous
+
+    def set_generation(self, collection, version, generation):
+        """Record the generation a collection version is built into, None when it is updated in place."""
+        self._execute(
+            "UPDATE units SET generation = ?, updated_at = ? WHERE collection = ? AND version = ?",
+            (generation, time.time(), collection, version),
+        )
+
+    def finish_unit(self, collection, version):
+        """Mark a collection version complete, and drop the embeddings of its chunks."""
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute(
+                "UPDATE units SET status = 'complete', batches = 0, generation = NULL, updated_at = ? "
+                "WHERE collection = ? AND version = ?",
+                (time.time(), collection, version),
+            )
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE collection = ? AND version = ?", (collection, version)
+            )
+            self._connection.execute("COMMIT")
+
+    def unit_status(self, collection, version):
+        rows = self._execute(
+            "SELECT status FROM units WHERE collection = ? AND version = ?", (collection, version)
+        )
+        return rows[0][0] if rows else None
+
+    def embeddings(self, collection, version, chunk_hashes):
+        """Stored embeddings of chunks of a version, by chunk hash."""
+        found = {}
+        chunk_hashes = list(set(chunk_hashes))
+        # Stays under the SQLite limit of bound parameters
+        for i in range(0, len(chunk_hashes), 500):
+            part = chunk_hashes[i:i + 500]
+            rows = self._execute(
+                f"SELECT chunk_hash, vector FROM embeddings WHERE collection = ? AND version = ? "
+                f"AND chunk_hash IN ({','.join('?' * len(part))})",
+                (collection, version, *part),
+            )
+            for chunk_hash, vector in rows:
+                found[chunk_hash] = array.array("f", vector).tolist()
+        return found
+
+    def add_embeddings(self, collection, version, chunk_hashes, embeddings):
+        """Store the embeddings of a batch of chunks, as float32."""
+        rows = [
+            (collection, version, chunk_hash, array.array("f", embedding).tobytes())
+            for chunk_hash, embedding in zip(chunk_hashes, embeddings)
+        ]
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._connection.execute(
+                "UPDATE units SET batches = batches + 1, updated_at = ? WHERE collection = ? AND version = ?",
+                (time.time(), collection, version),
+            )
+            self._connection.execute("COMMIT")
+
+    def page(self, url):
+        """Cached page as a dict of content_hash, validators and html, or None."""
+        rows = self._execute("SELECT content_hash, etag, last_modified, html FROM pages WHERE url = ?", (url,))
+        if not rows:
+            return None
+        content_hash, etag, last_modified, html = rows[0]
+        return {
+            "content_hash": content_hash,
+            "validators": {"etag": etag, "last_modified": last_modified},
+            "html": zlib.decompress(html).decode("utf-8"),
+        }
+
+    def put_page(self, url, html, validators):
+        """Cache the last fetched HTML of a page, returns its content hash."""
+        content_hash = page_hash(html)
+        self._execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            (
+                url,
+                content_hash,
+                (validators or {}).get("etag"),
+                (validators or {}).get("last_modified"),
+                zlib.compress(html.encode("utf-8")),
+            ),
+        )
+        return content_hash
+
+    def splits(self, url, content_hash, params):
+        """Cached splits of a page content with splitting parameters, or None."""
+        rows = self._execute(
+            "SELECT splits FROM splits WHERE url = ? AND content_hash = ? AND params = ?", (url, content_hash, params)
+        )
+        if not rows:
+            return None
+        return [Document(page_content=content, metadata=metadata) for content, metadata in _unpack(rows[0][0])]
+
+    def put_splits(self, url, content_hash, params, splits):
+        """Cache the splits of a page content, the splits of its previous contents are dropped."""
+        blob = _pack([[split.page_content, split.metadata] for split in splits])
+        with self._lock:
+            self._connection.execute("BEGIN")
+            self._connection.execute("DELETE FROM splits WHERE url = ? AND content_hash != ?", (url, content_hash))
+            self._connection.execute("INSERT OR REPLACE INTO splits VALUES (?, ?, ?, ?)", (url, content_hash, params, blob))
+            self._connection.execute("COMMIT")
@@ -0,0 +1,85 @@
+"""Migration of the per-version collections to one partitioned collection per product
+
+The chunks, their embeddings and their metadata are copied from every
+`{base}_{version}` collection to the `{base}` collection, where the version is
+the partition key. Nothing is embedded again. Uses the same environment variables
+as the ingestion.
+
+Usage:
+    python migrate_to_partitioned.py [--drop-old] [--batch-size 1000]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+import collections_loader as cl
+import milvus_handler as mh
+
+
+def load_collections():
+    collections = []
+    collection_loader = cl.CollectionLoader()
+    if os.getenv("COLLECTIONS_PATH") is not None:
+        collection_loader.fetch_collections_from_path(collections, os.getenv("COLLECTIONS_PATH"))
+    if os.getenv("COLLECTIONS_GIT_REPO_NAME") is not None:
+        collections = collection_loader.fetch_collections_from_git(
+            collections,
+            os.getenv("COLLECTIONS_GIT_REPO_NAME"),
+            os.getenv("COLLECTIONS_GIT_REPO_PATH"),
+            os.getenv("COLLECTIONS_GIT_REPO_BRANCH"),
+        )
+    return collections
+
+
+def migrate_version(handler, source_name, target_name, version_number, batch_size, index=None):
+    """Copy all the rows of a per-version collection to the partitioned collection"""
+    copied = 0
+    for rows in handler.iterate_rows(source_name, batch_size=batch_size):
+        rows = [handler.prepare_row({**row, "version": version_number}) for row in rows]
+        if handler.collection_check(target_name) is None:
+            handler.create_collection(target_name, dim=len(rows[0]["vector"]), index=index)
+        handler.insert_rows(target_name, rows)
+        copied += len(rows)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drop-old", action="store_true", help="Drop the per-version collections once copied")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows read per query")
+    args = parser.parse_args()
+
+    load_dotenv()
+    handler = mh.MilvusHandler(
+        os.getenv("MILVUS_URI"),
+        os.getenv("MILVUS_USERNAME"),
+        os.getenv("MILVUS_PASSWORD"),
+        os.getenv("MILVUS_DB"),
+        int(os.getenv("MILVUS_BATCH_SIZE", "32")),
+        hybrid_search=os.getenv("HYBRID_SEARCH", "false").lower() == "true",
+        collection_layout="partitioned",
+    )
+
+    for collection in load_collections():
+        target_name = mh.get_collection_name(collection.collection_base_name)
+        for version in collection.versions:
+            source_name = mh.get_collection_name(collection.collection_base_name, version.version_number)
+            if handler.collection_check(source_name) is None:
+                print(f'⏭️ "{source_name}" not present, skipping')
+                continue
+            if handler.version_check(collection, version):
+                print(f'⏭️ Version {version.version_number} already in "{target_name}", skipping')
+                continue
+            print(f'▶️ Copying "{source_name}" to "{target_name}"')
+            copied = migrate_version(
+                handler, source_name, target_name, version.version_number, args.batch_size, collection.index
+            )
+            print(f"✅ Copied {copied} chunks")
+            if args.drop_old:
+                handler.collection_delete(source_name)
+                print(f'🗑️ Dropped "{source_name}"')
+
+
+if __name__ == "__main__":
+    main()
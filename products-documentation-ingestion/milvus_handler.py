@@ -1,18 +1,98 @@
+import hashlib
+import itertools
+import json
 import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain_milvus import Milvus
-from langchain_community.embeddings import HuggingFaceInferenceAPIEmbeddings
-from pymilvus import MilvusClient
+from pymilvus import Collection, DataType, MilvusClient, MilvusException, connections
 from dotenv import load_dotenv
 
 import doc_processing_rh_doc as dp_rh
 import doc_processing_docling_server as dp_ds
+from bulk_loader import BulkLoader
+from embedding_dispatcher import EmbeddingDispatcher
+from ingestion_progress import IngestionProgress
+from ingestion_worklog import IngestionWorkLog
+import sparse_encoder
 
 os.environ["TRANSFORMERS_VERBOSITY"] = "error"
 os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "1"
 
 load_dotenv()
 
+# Metadata stored as indexed scalar fields, so retrieval can filter on them
+SCALAR_FIELDS = {
+    "product": 256,
+    "version": 64,
+    "language": 16,
+    "title": 1024,
+    "source": 2048,
+    "header_path": 2048,
+    "content_hash": 64,
+}
+
+# Build parameters of the supported ANN indexes, used when a collection doesn't set them.
+# Collections without an "index" entry get AUTOINDEX, which Milvus Lite builds too.
+# The metric stays L2: the score threshold of the retrievers is an L2 distance.
+INDEX_DEFAULTS = {
+    "AUTOINDEX": {},
+    "FLAT": {},
+    "HNSW": {"M": 8, "efConstruction": 64},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "DISKANN": {},
+}
+
+# Vector indexes Milvus Lite builds, in a local .db file
+LITE_INDEX_TYPES = ("FLAT", "IVF_FLAT", "AUTOINDEX")
+
+
+def index_spec(index=None):
+    """Index type and build parameters of a collection, from its "index" entry"""
+    index = index or {}
+    index_type = index.get("index_type", "AUTOINDEX").upper()
+    if index_type not in INDEX_DEFAULTS:
+        raise ValueError(f"Unsupported index type {index_type}, expected one of {', '.join(INDEX_DEFAULTS)}")
+    return index_type, {**INDEX_DEFAULTS[index_type], **index.get("params", {})}
+
+
+def get_collection_name(collection_base_name, version_number=None):
+    """Milvus collection name of a collection, per version unless the collection is partitioned"""
+    if version_number is None:
+        collection_name = collection_base_name
+    else:
+        collection_name = f"{collection_base_name}_{version_number}"
+    # Replace needed because Milvus collection names cannot contain hyphens or periods
+    return collection_name.replace("-", "_").replace(".", "_")
+
+
+def version_filter(version_number):
+    return 'version == "' + version_number.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def content_hash(source, page_content):
+    """Hash identifying a chunk, to find the unchanged ones at re-ingestion"""
+    return hashlib.sha256(f"{source}\n{page_content}".encode("utf-8")).hexdigest()
+
+
+def generation_name(collection_name):
+    """Name of a new generation of a collection served through an alias"""
+    return f"{collection_name}__{time.strftime('%Y%m%d%H%M%S', time.gmtime())}"
+
+
+def header_path(metadata):
+    """Section path of a split, from its Markdown headers"""
+    return " / ".join(
+        metadata[header_name] for header_name in ["Header 1", "Header 2", "Header 3"] if header_name in metadata
+    )
+
+
 class MilvusHandler:
     def __init__(
         self,
@@ -23,7 +103,14 @@ class MilvusHandler:
         milvus_batch_size=32,
         embeddings_api_url="",
         embeddings_api_key="",
-        embeddings_model_name=""
+        embeddings_model_name="",
+        hybrid_search=False,
+        collection_layout="per_version",
+        manifest_path=None,
+        bulk_load=False,
+        worklog_path=None,
+        blue_green=True,
+        keep_generations=2
     ):
         self.milvus_uri = milvus_uri
         self.milvus_username = milvus_username
@@ -33,112 +120,641 @@ class MilvusHandler:
         self.embeddings_api_url = embeddings_api_url
         self.embeddings_api_key = embeddings_api_key
         self.embeddings_model_name = embeddings_model_name
+        self.hybrid_search = hybrid_search
+        # Milvus Lite only builds some vector indexes, and no scalar ones are needed
+        self.milvus_lite = str(milvus_uri).endswith(".db")
+        # "per_version": one collection per version, "partitioned": one collection per
+        # product with the version as partition key
+        self.collection_layout = collection_layout
+        # JSON file keeping the ETag and Last-Modified of the fetched pages between runs
+        self.manifest_path = manifest_path
+        self._manifest_lock = threading.Lock()
+        # Per-version rebuilds go to a new generation of the collection, served through an
+        # alias once complete; the previous generations are kept for rollbacks
+        self.aliases_supported = not str(milvus_uri).endswith(".db")
+        # Milvus Lite has no aliases, its collections are rebuilt in place
+        self.blue_green = blue_green and self.aliases_supported
+        self.keep_generations = keep_generations
+        # SQLite work log of the versions in progress, and cache of the pages and splits
+        self.worklog = IngestionWorkLog(worklog_path) if worklog_path else None
         self.client = MilvusClient(
             uri=self.milvus_uri,
             user=self.milvus_username,
             password=self.milvus_password,
             db_name=self.milvus_db
         )
-        self.embeddings = HuggingFaceInferenceAPIEmbeddings(
+        # Connection of the ORM API, for the query iterators
+        self.connection_alias = f"ingestion_{id(self)}"
+        connections.connect(
+            alias=self.connection_alias,
+            uri=self.milvus_uri,
+            user=self.milvus_username,
+            password=self.milvus_password,
+            db_name=self.milvus_db
+        )
+        # Several embedding requests in flight, with batch sizes adapted to the server
+        self.embeddings = EmbeddingDispatcher(
             api_url=self.embeddings_api_url,
             api_key=self.embeddings_api_key,
-            model_name=self.embeddings_model_name
+            model_name=self.embeddings_model_name,
+            concurrency=int(os.getenv("EMBEDDINGS_CONCURRENCY", "4")),
+            batch_size=int(os.getenv("EMBEDDINGS_BATCH_SIZE", "32")),
+            max_batch_size=int(os.getenv("EMBEDDINGS_MAX_BATCH_SIZE", "256")),
+            target_latency=float(os.getenv("EMBEDDINGS_TARGET_LATENCY", "2")),
+            retries=int(os.getenv("EMBEDDINGS_RETRIES", "5"))
         )
+        # Embedded rows staged in local files and loaded once the version is embedded
+        self.bulk_loader = None
+        if bulk_load:
+            self.bulk_loader = BulkLoader(
+                client=self.client,
+                connection_alias=self.connection_alias,
+                staging_dir=os.getenv("BULK_LOAD_DIR") or tempfile.gettempdir(),
+                s3_endpoint=os.getenv("BULK_LOAD_S3_ENDPOINT", ""),
+                s3_access_key=os.getenv("BULK_LOAD_S3_ACCESS_KEY", ""),
+                s3_secret_key=os.getenv("BULK_LOAD_S3_SECRET_KEY", ""),
+                s3_bucket=os.getenv("BULK_LOAD_S3_BUCKET", "a-bucket"),
+                s3_secure=os.getenv("BULK_LOAD_S3_SECURE", "false").lower() == "true",
+                insert_batch_size=int(os.getenv("BULK_LOAD_INSERT_BATCH_SIZE", "10000"))
+            )
         # check_embedding_ctx_length=False,
 
     def collection_check(self, collection_name):
         collections = self.client.list_collections()
-        if collection_name in collections:
+        if collection_name in collections or self.alias_target(collection_name) is not None:
             return self.client.describe_collection(collection_name)
         else:
             return None
 
     def collection_delete(self, collection_name):
+        """Drop a collection, or an alias and all the generations behind it"""
         collections = self.client.list_collections()
-        if collection_name in collections:
+        to_drop = [collection_name] if collection_name in collections else []
+        if self.alias_target(collection_name) is not None:
+            self.client.drop_alias(collection_name)
+            to_drop = self.generations(collection_name)
+        for name in to_drop:
             try:
-                self.client.drop_collection(collection_name)
+                self.client.drop_collection(name)
             except Exception as e:
-                print(f'Error dropping "{collection_name}"')
+                print(f'Error dropping "{name}"')
                 print(f"{e}")
 
+    def alias_target(self, alias):
+        """Collection an alias points to, or None if it isn't an alias"""
+        if not self.aliases_supported:
+            return None
+        try:
+            return self.client.describe_alias(alias)["collection_name"]
+        except MilvusException:
+            return None
+
+    def generations(self, collection_name):
+        """Generations of a collection served through an alias, oldest first"""
+        pattern = re.compile(re.escape(collection_name) + r"__\d{14}")
+        return sorted(name for name in self.client.list_collections() if pattern.fullmatch(name))
+
+    def prune_generations(self, collection_name, building=None):
+        """
+        Drop the generations that are neither served nor kept for rollbacks.
+
+        A generation is only served once its row count is checked, so the generations
+        newer than the served one, or all of them when there is no alias yet, are
+        unchecked leftovers of interrupted rebuilds, except the one being built, when
+        an interrupted rebuild is resumed. The older ones were all served.
+        """
+        target = self.alias_target(collection_name)
+        generations = self.generations(collection_name)
+        if target is None:
+            to_drop = [name for name in generations if name != building]
+        else:
+            older = [name for name in generations if name < target]
+            kept = set(older[max(0, len(older) - self.keep_generations + 1):]) | {target, building}
+            to_drop = [name for name in generations if name not in kept]
+        for name in to_drop:
+            print(f'🗑️ Dropping generation "{name}"')
+            self.client.drop_collection(name)
+
+    def swap_alias(self, collection_name, generation, expected_rows):
+        """
+        Serve a new generation of a collection, once it is complete and loaded.
+
+        The alias moves atomically. A collection still in place under its own name is
+        renamed as the oldest generation, so it can be rolled back to, right before the
+        alias takes its name. An empty generation is never served.
+        """
+        if expected_rows == 0:
+            raise RuntimeError(f'"{generation}" is empty, "{collection_name}" is left unchanged')
+        self.client.flush(generation)
+        rows = self.client.query(
+            generation, filter="", output_fields=["count(*)"], consistency_level="Strong"
+        )[0]["count(*)"]
+        if rows != expected_rows:
+            raise RuntimeError(
+                f'"{generation}" has {rows} rows instead of {expected_rows}, "{collection_name}" is left unchanged'
+            )
+        self.client.load_collection(generation)
+        if self.alias_target(collection_name) is not None:
+            self.client.alter_alias(generation, collection_name)
+        elif collection_name in self.client.list_collections():
+            # Milvus doesn't let an alias take the name of a collection, so the collection in
+            # place is renamed right before the alias is created, everything else is done by
+            # then. The name is back on the old collection if the alias can't be created.
+            legacy_name = f"{collection_name}__{'0' * 14}"
+            self.client.rename_collection(collection_name, legacy_name)
+            try:
+                self.client.create_alias(generation, collection_name)
+            except Exception:
+                self.client.rename_collection(legacy_name, collection_name)
+                raise
+        else:
+            self.client.create_alias(generation, collection_name)
+        print(f'🔀 "{collection_name}" now serves "{generation}" ({rows} rows)')
+        self.prune_generations(collection_name)
+
+    def rollback(self, collection_name, generation=None):
+        """Serve the generation before the current one, or a given generation, returns it"""
+        target = self.alias_target(collection_name)
+        if target is None:
+            raise ValueError(f'"{collection_name}" is not served through an alias')
+        if generation is None:
+            older = [name for name in self.generations(collection_name) if name < target]
+            if not older:
+                raise ValueError(f'No generation of "{collection_name}" older than "{target}"')
+            generation = older[-1]
+        elif generation not in self.generations(collection_name):
+            raise ValueError(f'"{generation}" is not a generation of "{collection_name}"')
+        self.client.load_collection(generation)
+        self.client.alter_alias(generation, collection_name)
+        return generation
+
+
+    @property
+    def partitioned(self):
+        return self.collection_layout == "partitioned"
+
+    def get_collection_name(self, collection, version):
+        """Milvus collection holding a version of a collection, depending on the layout"""
+        if self.partitioned:
+            return get_collection_name(collection.collection_base_name)
+        return get_collection_name(collection.collection_base_name, version.version_number)
+
+    def version_check(self, collection, version):
+        """Check if a version of a collection is already ingested"""
+        collection_name = self.get_collection_name(collection, version)
+        if self.collection_check(collection_name) is None:
+            return False
+        if not self.partitioned:
+            return True
+        return len(self.client.query(
+            collection_name, filter=version_filter(version.version_number), output_fields=["pk"], limit=1
+        )) > 0
+
+    def version_interrupted(self, collection, version):
+        """Check if the last ingestion of a version of a collection didn't complete"""
+        if self.worklog is None:
+            return False
+        collection_name = self.get_collection_name(collection, version)
+        return self.worklog.unit_status(collection_name, version.version_number) == "in_progress"
+
+    def version_delete(self, collection, version):
+        """Delete a version of a collection"""
+        collection_name = self.get_collection_name(collection, version)
+        if not self.partitioned:
+            self.collection_delete(collection_name)
+        elif self.collection_check(collection_name) is not None:
+            self.client.delete(collection_name, filter=version_filter(version.version_number))
+
+    def iterate_rows(self, collection_name, expr="", output_fields=None, batch_size=1000):
+        """Iterate over all the rows of a collection matching a filter, in batches"""
+        collection = Collection(collection_name, using=self.connection_alias)
+        collection.load()
+        iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields or ["*"])
+        try:
+            while True:
+                rows = iterator.next()
+                if not rows:
+                    break
+                yield rows
+        finally:
+            iterator.close()
+
+    def existing_chunks(self, collection, version, collection_name=None):
+        """Primary keys of the stored chunks of a version, by source and content hash"""
+        # The served collection, or the generation of a rebuild in progress
+        collection_name = collection_name or self.get_collection_name(collection, version)
+        chunks = defaultdict(lambda: defaultdict(list))
+        if self.collection_check(collection_name) is None:
+            return chunks
+        expr = version_filter(version.version_number) if self.partitioned else ""
+        for rows in self.iterate_rows(collection_name, expr, ["pk", "source", "content_hash"]):
+            for row in rows:
+                # Chunks ingested before content hashes have none, they are replaced
+                chunks[row.get("source")][row.get("content_hash")].append(row["pk"])
+        return chunks
+
+    def load_manifest(self):
+        if not self.manifest_path or not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            return json.load(f)
+
+    def save_manifest(self, key, entries):
+        """Replace the entries of a collection version, versions may be ingested concurrently"""
+        if not self.manifest_path:
+            return
+        with self._manifest_lock:
+            manifest = self.load_manifest()
+            manifest[key] = entries
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+
+    def collection_schema(self, dim):
+        """Schema used by the retrievers, with a sparse field for hybrid search"""
+        schema = self.client.create_schema(auto_id=True, enable_dynamic_field=True)
+        schema.add_field("pk", DataType.INT64, is_primary=True)
+        schema.add_field("page_content", DataType.VARCHAR, max_length=65535)
+        schema.add_field("vector", DataType.FLOAT_VECTOR, dim=dim)
+        if self.hybrid_search:
+            schema.add_field("sparse", DataType.SPARSE_FLOAT_VECTOR)
+        for field_name, max_length in SCALAR_FIELDS.items():
+            schema.add_field(
+                field_name,
+                DataType.VARCHAR,
+                max_length=max_length,
+                is_partition_key=self.partitioned and field_name == "version",
+            )
+        return schema
+
+    def index_params(self, index=None, fallback=False):
+        """Indexes of the vector, sparse and scalar fields, only AUTOINDEX or the ones of Milvus Lite as fallback"""
+        index_type, index_build_params = index_spec(index)
+        lite = self.milvus_lite or fallback
+        if lite and index_type not in LITE_INDEX_TYPES:
+            index_type, index_build_params = "AUTOINDEX", {}
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="vector",
+            index_type=index_type,
+            metric_type="L2",
+            params=index_build_params,
+        )
+        if self.hybrid_search:
+            index_params.add_index(
+                field_name="sparse",
+                index_type="SPARSE_INVERTED_INDEX",
+                metric_type="IP",
+                params={"drop_ratio_build": 0.2},
+            )
+        if not lite:
+            for field_name in SCALAR_FIELDS:
+                index_params.add_index(field_name=field_name, index_type="INVERTED")
+        return index_params
+
+    def create_collection(self, collection_name, dim, index=None, build_index=True):
+        """Create a collection, without indexes (nor loading it) when they are built after a bulk load"""
+        self.client.create_collection(collection_name, schema=self.collection_schema(dim))
+        if build_index:
+            self.create_index(collection_name, index)
+
+    def create_index(self, collection_name, index=None):
+        """Build the indexes of a collection created without them, and load it"""
+        try:
+            self.client.create_index(collection_name, self.index_params(index))
+        except MilvusException as e:
+            # The vector index comes first, nothing is built when the server rejects it
+            print(f"⚠️ Could not build the indexes of {collection_name}, falling back to AUTOINDEX: {e}")
+            self.client.create_index(collection_name, self.index_params(index, fallback=True))
+        self.client.load_collection(collection_name)
+
+    def prepare_row(self, row):
+        """Fill the scalar and sparse fields of a row holding page_content, vector and metadata"""
+        row.pop("pk", None)
+        row["header_path"] = row.get("header_path") or header_path(row)
+        row["content_hash"] = row.get("content_hash") or content_hash(row.get("source"), row["page_content"])
+        for field_name, max_length in SCALAR_FIELDS.items():
+            # VARCHAR lengths are in bytes
+            value = str(row.get(field_name) or "").encode("utf-8")[:max_length]
+            row[field_name] = value.decode("utf-8", errors="ignore")
+        if self.hybrid_search and "sparse" not in row:
+            row["sparse"] = sparse_encoder.encode_document(row["page_content"])
+        return row
+
+    def insert_rows(self, collection_name, rows):
+        for i in range(0, len(rows), self.milvus_batch_size):
+            self.client.insert(collection_name, rows[i:i + self.milvus_batch_size])
+
+    def document_rows(self, documents, embeddings, version_number):
+        """Rows of documents and their embeddings, metadata goes to dynamic fields"""
+        return [
+            self.prepare_row({
+                **document.metadata,
+                # Common sources have no version of their own
+                "version": version_number,
+                "page_content": document.page_content,
+                "vector": embedding,
+            })
+            for document, embedding in zip(documents, embeddings)
+        ]
+
+    def insert_documents(self, collection_name, documents, embeddings, version_number):
+        """Insert documents and their embeddings"""
+        self.insert_rows(collection_name, self.document_rows(documents, embeddings, version_number))
+
+    def insert_batch(self, collection_name, documents, embeddings, version_number, progress, writer=None):
+        """Insert a batch, or stage it in the files of a bulk load"""
+        if writer is None:
+            self.insert_documents(collection_name, documents, embeddings, version_number)
+            progress.add("inserted", len(documents))
+            return
+        for row in self.document_rows(documents, embeddings, version_number):
+            writer.append_row(row)
+        progress.add("staged", len(documents))
+
+    def embed_batch(self, collection_name, version_number, splits, progress):
+        """Embed a batch of splits, reusing and checkpointing the embeddings of the work log"""
+        if self.worklog is None:
+            embeddings = self.embeddings.embed_documents([split.page_content for split in splits])
+            progress.add("embedded", len(splits))
+            return embeddings
+        hashes = [content_hash(split.metadata.get("source"), split.page_content) for split in splits]
+        stored = self.worklog.embeddings(collection_name, version_number, hashes)
+        missing = [i for i, chunk_hash in enumerate(hashes) if chunk_hash not in stored]
+        if missing:
+            new_embeddings = self.embeddings.embed_documents([splits[i].page_content for i in missing])
+            self.worklog.add_embeddings(collection_name, version_number, [hashes[i] for i in missing], new_embeddings)
+            stored.update(zip((hashes[i] for i in missing), new_embeddings))
+        progress.add("embedded", len(missing))
+        progress.add("embeddings_reused", len(splits) - len(missing))
+        return [stored[chunk_hash] for chunk_hash in hashes]
 
-    def per_type_ingestion(self, splits, source, collection, version, chunk_size, chunk_overlap):
+    def per_type_splits(self, source, collection, version, chunk_size, chunk_overlap, validators=None, unchanged=None, progress=None):
+        """Stream the splits of a source"""
         if source.ingestion_type == "docling_server":
-                splits += dp_ds.generate_splits(
-                        source.urls,
-                        product=collection.collection_base_name,
-                        product_full_name=collection.collection_full_name,
-                        chunk_size=chunk_size,
-                        chunk_overlap=chunk_overlap
-                    )
+            yield from dp_ds.iter_splits(
+                source.urls,
+                product=collection.collection_base_name,
+                product_full_name=collection.collection_full_name,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                progress=progress
+            )
         elif source.ingestion_type == "redhat_doc":
-            splits += dp_rh.generate_splits(
+            yield from dp_rh.iter_splits(
                 collection.collection_base_name,
                 collection.collection_full_name,
                 version.version_number,
                 source.language,
                 chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap
+                chunk_overlap=chunk_overlap,
+                validators=validators,
+                unchanged=unchanged,
+                progress=progress,
+                cache=self.worklog
             )
 
+    def upstream_hosts(self, collection, version):
+        """Hosts the sources of a version are fetched from"""
+        hosts = set()
+        for source in list(collection.common_sources or []) + list(version.sources):
+            if source.ingestion_type == "docling_server":
+                hosts.add(dp_ds.upstream_host())
+            elif source.ingestion_type == "redhat_doc":
+                hosts.add(dp_rh.upstream_host())
+        return hosts
 
-    def ingest_documentation(self, collection, version, chunk_size=768, chunk_overlap=128, drop_old=True, batch_size=600):
-        """Ingest documentation into Milvus"""
+    def iter_splits(self, collection, version, chunk_size, chunk_overlap, validators=None, unchanged=None, progress=None):
+        """Stream the splits of the common sources of a collection, then of the sources of a version"""
+        for source in list(collection.common_sources or []) + list(version.sources):
+            for split in self.per_type_splits(
+                source, collection, version, chunk_size, chunk_overlap, validators, unchanged, progress
+            ):
+                if progress is not None:
+                    progress.add("splits")
+                yield split
 
-        collection_name = (
-            f"{collection.collection_base_name}_{version.version_number}".replace(
-                "-", "_"
-            ).replace(".", "_")
-        )
-        # Replace needed because Milvus collection names cannot contain hyphens or periods
+    def select_changed_splits(self, splits, remaining, progress=None):
+        """
+        Filter the splits already stored out of a stream of fresh splits.
 
-        splits = []
+        `remaining` counts the stored chunks by (source, content hash); it is decremented
+        for every split found, what is left afterwards are the chunks that disappeared.
+        """
+        for split in splits:
+            key = (split.metadata.get("source"), content_hash(split.metadata.get("source"), split.page_content))
+            if remaining.get(key, 0) > 0:
+                remaining[key] -= 1
+                if progress is not None:
+                    progress.add("splits_unchanged")
+            else:
+                yield split
 
-        # if the collection has common sources, add them to the splits
-        if collection.common_sources:
-            for source in collection.common_sources:
-                self.per_type_ingestion(splits, source, collection, version, chunk_size, chunk_overlap)
+    def chunks_to_delete(self, existing, remaining, unchanged):
+        """Primary keys of the stored chunks that disappeared, except those of unchanged pages"""
+        to_delete = []
+        for source, hashes in existing.items():
+            if source in unchanged:
+                continue
+            for chunk_hash, pks in hashes.items():
+                # Leftover count: chunks stored more times than they are still present
+                leftover = remaining[(source, chunk_hash)]
+                to_delete.extend(pks[len(pks) - leftover:] if leftover else [])
+        return to_delete
 
-        # add the splits from selected version
-        for source in version.sources:
-            self.per_type_ingestion(splits, source, collection, version, chunk_size, chunk_overlap)
+    def ingest_documentation(self, collection, version, chunk_size=768, chunk_overlap=128, drop_old=True, batch_size=600, incremental=False):
+        """
+        Ingest documentation into Milvus.
 
-        vector_store = Milvus(
-            embedding_function=self.embeddings,
-            connection_args={
-                "uri": self.milvus_uri,
-                "user": self.milvus_username,
-                "password": self.milvus_password,
-                "db_name": self.milvus_db,
-            },
-            collection_name=collection_name,
-            enable_dynamic_field=True,
-            text_field="page_content",
-            auto_id=True,
-            drop_old=drop_old,
-        )
+        The stages are streamed: pages are fetched, converted and split a bounded number
+        of pages ahead, while batches of splits are embedded, and each batch is inserted
+        while the next one is embedded. Memory doesn't grow with the size of the version.
+
+        With incremental, the collection is not rebuilt: unchanged pages are not fetched
+        again when the server supports conditional requests, only new or changed chunks are
+        embedded and inserted, and the chunks that disappeared are deleted.
+
+        With a bulk loader, the embedded rows are staged in local files instead, and loaded
+        once the whole version is embedded. A collection created for the load gets its
+        indexes built once, after the load, instead of incrementally.
+
+        A rebuild of a per-version collection, with blue_green, goes to a new generation of
+        the collection. It replaces the served one by moving its alias, once its row count is
+        checked and it is indexed and loaded. The served collection stays available meanwhile.
+
+        With a work log, the embeddings of every batch are checkpointed until the version
+        is complete. A version whose last ingestion was interrupted is resumed: the chunks
+        already stored are kept, like an incremental update, and the chunks embedded but not
+        stored yet are not embedded again. An interrupted blue/green rebuild is resumed in
+        the generation it was building, which is then served like any other rebuild. Pages are revalidated against the page cache
+        rather than downloaded again, and their cached splits are reused.
+
+        Returns the counters of the ingestion stages.
+        """
+
+        collection_name = self.get_collection_name(collection, version)
+        progress = IngestionProgress(f"{collection_name} {version.version_number}")
+
+        previous = None
+        if self.worklog is not None:
+            previous = self.worklog.start_unit(collection_name, version.version_number, chunk_size, chunk_overlap)
+        resuming = previous is not None and previous["status"] == "in_progress"
+        # The unchanged pages of the last ingestion were split with other parameters
+        rechunking = previous is not None and (previous["chunk_size"], previous["chunk_overlap"]) != (chunk_size, chunk_overlap)
+        # Generation of an interrupted blue/green rebuild, resumed rather than started over
+        resumed_generation = None
+        if resuming:
+            print(
+                f"Resuming the interrupted ingestion of {collection_name} {version.version_number} "
+                f"({previous['batches']} batch(es) embedded)"
+            )
+            incremental = True
+            if previous["generation"] is not None and self.blue_green and not self.partitioned:
+                resumed_generation = previous["generation"]
+                print(f'Resuming the rebuild of "{resumed_generation}"')
+            if self.aliases_supported and not self.partitioned:
+                # The leftovers of older interrupted rebuilds are never served
+                self.prune_generations(collection_name, building=resumed_generation)
+
+        existing = {}
+        remaining = {}
+        unchanged = set()
+        page_sources = set()
+        manifest = self.load_manifest()
+        manifest_key = f"{collection_name}/{version.version_number}"
+        validators = {}
+        if incremental:
+            existing = self.existing_chunks(collection, version, resumed_generation)
+            remaining = {
+                (source, chunk_hash): len(pks)
+                for source, hashes in existing.items()
+                for chunk_hash, pks in hashes.items()
+            }
+        if incremental and not resuming and not rechunking:
+            # Conditional fetches only for the pages whose chunks are still stored
+            validators = {
+                url: page_validators
+                for url, page_validators in manifest.get(manifest_key, {}).items()
+                if url in existing
+            }
+
+        def tracked_splits():
+            for split in self.iter_splits(collection, version, chunk_size, chunk_overlap, validators, unchanged, progress):
+                page_sources.add(split.metadata.get("source"))
+                yield split
+
+        splits = tracked_splits()
+        if incremental:
+            splits = self.select_changed_splits(splits, remaining, progress)
 
         print(
             f"Calculating embeddings and uploading documents to collection {collection_name}"
         )
 
-        # Process in batches of 600
-        total_splits = len(splits)
-        for i in range(0, total_splits, batch_size):
-            end_idx = min(i + batch_size, total_splits)
-            current_batch = splits[i:end_idx]
-            print(f"Processing batch {i//batch_size + 1}/{(total_splits + batch_size - 1)//batch_size}: documents {i} to {end_idx-1}")
-            vector_store.add_documents(current_batch, batch_size=self.milvus_batch_size)
+        # A rebuild of a per-version collection goes to a new generation, the served one
+        # stays untouched until the new one is complete
+        blue_green = resumed_generation is not None or (
+            self.blue_green and not self.partitioned and drop_old and not incremental
+        )
+        target_name = collection_name
+        if resumed_generation is not None:
+            target_name = resumed_generation
+        elif blue_green:
+            # Drops the leftovers of interrupted rebuilds
+            self.prune_generations(collection_name)
+            target_name = generation_name(collection_name)
+            print(f'Building "{target_name}", served as "{collection_name}" once complete')
+        if self.worklog is not None:
+            # Recorded before the generation is created, a resumed run builds it under the same name
+            self.worklog.set_generation(collection_name, version.version_number, target_name if blue_green else None)
 
+        collection_exists = self.collection_check(target_name) is not None
+        dropped = not drop_old or incremental or blue_green
+        writer = None
+        with ThreadPoolExecutor(max_workers=1) as inserter:
+            pending_insert = None
+            batch_number = 0
+            while True:
+                current_batch = list(itertools.islice(splits, batch_size))
+                if not current_batch:
+                    break
+                batch_number += 1
+                print(f"Processing batch {batch_number}: {len(current_batch)} documents")
+                embeddings = self.embed_batch(collection_name, version.version_number, current_batch, progress)
+                if pending_insert is not None:
+                    pending_insert.result()
+                if self.bulk_loader is not None:
+                    if writer is None:
+                        dim = len(embeddings[0])
+                        writer = self.bulk_loader.stage(self.collection_schema(dim))
+                elif not dropped:
+                    # The old version stays available until the new one is ready to be inserted
+                    self.version_delete(collection, version)
+                    collection_exists = self.collection_check(target_name) is not None
+                    dropped = True
+                if not collection_exists and writer is None:
+                    # The dimension is known once the first embeddings are calculated
+                    self.create_collection(target_name, dim=len(embeddings[0]), index=collection.index)
+                    collection_exists = True
+                pending_insert = inserter.submit(
+                    self.insert_batch,
+                    target_name,
+                    current_batch,
+                    embeddings,
+                    version.version_number,
+                    progress,
+                    writer,
+                )
+            if pending_insert is not None:
+                pending_insert.result()
+        if not dropped:
+            # Nothing left to ingest, or the staged rows are ready to be loaded
+            self.version_delete(collection, version)
+            collection_exists = self.collection_check(target_name) is not None
+        if writer is not None:
+            build_index = not collection_exists
+            if build_index:
+                self.create_collection(target_name, dim=dim, index=collection.index, build_index=False)
+                collection_exists = True
+            print(f"Loading {progress.counters['staged']} staged documents into collection {target_name}")
+            progress.add("inserted", self.bulk_loader.load(target_name, writer))
+            if build_index:
+                print(f"Building the indexes of collection {target_name}")
+                self.create_index(target_name, collection.index)
+
+        # Deleted last, so the version stays complete if the ingestion fails midway
+        to_delete = self.chunks_to_delete(existing, remaining, unchanged) if incremental else []
+        # Rows of the new generation: the inserted ones, and the ones kept by a resumed rebuild
+        generation_rows = progress.counters["inserted"] + sum(
+            len(pks) for hashes in existing.values() for pks in hashes.values()
+        ) - len(to_delete)
+        if blue_green and generation_rows == 0:
+            # An empty or failed crawl must not take the served generation and its rollbacks down
+            print(f'⚠️ Nothing ingested for "{collection_name}", it is left unchanged')
+            if collection_exists:
+                self.client.drop_collection(target_name)
+            to_delete = []
+        for i in range(0, len(to_delete), self.milvus_batch_size):
+            self.client.delete(target_name, ids=to_delete[i:i + self.milvus_batch_size])
+        progress.add("deleted", len(to_delete))
+        if blue_green and generation_rows > 0:
+            self.swap_alias(collection_name, target_name, generation_rows)
+        page_sources |= unchanged
+        self.save_manifest(manifest_key, {
+            url: page_validators for url, page_validators in validators.items() if url in page_sources
+        })
+
+        if self.worklog is not None:
+            self.worklog.finish_unit(collection_name, version.version_number)
+
+        progress.report()
+        print(f"Embedding requests: {self.embeddings.stats()}")
         print("Ingestion finished!")
+        return dict(progress.counters)
 
     def similarity_search_with_score(self, collection, version, query, top_k=4):
-        collection_name = (
-            f"{collection.collection_base_name}_{version.version_number}".replace(
-                "-", "_"
-            ).replace(".", "_")
-        )
+        collection_name = self.get_collection_name(collection, version)
 
         vector_store = Milvus(
             embedding_function=self.embeddings,
@@ -155,6 +771,8 @@ class MilvusHandler:
             drop_old=False,
         )
 
-        results = vector_store.similarity_search_with_score(query, k=top_k)
+        results = vector_store.similarity_search_with_score(
+            query, k=top_k, expr=version_filter(version.version_number) if self.partitioned else None
+        )
 
         return results
@@ -0,0 +1,45 @@
+"""Rollback of a collection version served through an alias
+
+Lists the generations of a per-version collection kept by the blue/green ingestion,
+and moves its alias back to the previous one, or to a given one. Uses the same
+environment variables as the ingestion.
+
+Usage:
+    python rollback_collection.py <collection> [--list] [--to <generation>]
+    python rollback_collection.py openshift_container_platform_4_18 --list
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+import milvus_handler as mh
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("collection", help="Served collection name, e.g. {base}_{version}")
+    parser.add_argument("--list", action="store_true", help="List the generations and exit")
+    parser.add_argument("--to", help="Generation to serve, the one before the current one by default")
+    args = parser.parse_args()
+
+    load_dotenv()
+    handler = mh.MilvusHandler(
+        os.getenv("MILVUS_URI"),
+        os.getenv("MILVUS_USERNAME"),
+        os.getenv("MILVUS_PASSWORD"),
+        os.getenv("MILVUS_DB"),
+        int(os.getenv("MILVUS_BATCH_SIZE", "32")),
+    )
+
+    served = handler.alias_target(args.collection)
+    if args.list:
+        for generation in handler.generations(args.collection):
+            print(f"{'*' if generation == served else ' '} {generation}")
+        return
+    generation = handler.rollback(args.collection, args.to)
+    print(f'🔀 "{args.collection}" now serves "{generation}" instead of "{served}"')
+
+
+if __name__ == "__main__":
+    main()
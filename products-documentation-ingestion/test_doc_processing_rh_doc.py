@@ -0,0 +1,132 @@
+"""Fetching and splitting Red Hat documentation pages, against a local server
+
+Run with: python -m pytest test_doc_processing_rh_doc.py
+"""
+import asyncio
+import http.server
+import threading
+from urllib.parse import urlsplit
+
+import aiohttp
+import pytest
+
+import doc_processing_rh_doc as rh
+
+BOOKS = 3
+
+BOOK = """<html><body><h1 class="title">Book {i}</h1><div class="book">
+<h2>Installing book {i}</h2><p>Run the installer of book {i} on every node of the cluster.</p>
+<h2>Upgrading book {i}</h2><p>Upgrade book {i} one node at a time, draining it first.</p>
+</div></body></html>"""
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    # Responses served before the page itself, by path
+    failures = {}
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        failures = self.failures.get(self.path, [])
+        if failures:
+            failure = failures.pop(0)
+            if failure == "truncated":
+                # Announces more than it sends, the client reads a body cut short
+                self.send_response(200)
+                self.send_header("Content-Length", "1000")
+                self.end_headers()
+                self.wfile.write(b"<html>")
+                self.close_connection = True
+            else:
+                self.send_response(failure)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            return
+        if self.path.startswith("/documentation/"):
+            body = "<html><body>" + "".join(
+                f'<h3 slot="headline"><a href="/en/documentation/prod/1.0/html/book{i}">Book {i}</a></h3>'
+                for i in range(BOOKS)
+            ) + "</body></html>"
+        elif "/book" in self.path:
+            body = BOOK.format(i=self.path.rsplit("book", 1)[-1])
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = body.encode("utf-8")
+        etag = f'"{len(data)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{httpd.server_port}"
+    monkeypatch.setenv("RH_DOCS_BASE_URL", base_url)
+    monkeypatch.setenv("RH_DOCS_INDEX_URL", base_url + "/documentation")
+    monkeypatch.setenv("RH_DOCS_SPLIT_WORKERS", "2")
+    yield base_url
+    httpd.shutdown()
+    Handler.failures.clear()
+
+
+def fetch(url, **kwargs):
+    async def run():
+        host_limits = {urlsplit(url).netloc: asyncio.Semaphore(1)}
+        async with aiohttp.ClientSession() as session:
+            return await rh.fetch_page(session, url, host_limits, backoff=0.01, **kwargs)
+
+    return asyncio.run(run())
+
+
+def test_generate_splits_in_page_order(server):
+    validators = {}
+    splits = rh.generate_splits("prod", "Product", "1.0", "en-US", 768, 128, validators)
+    sources = [split.metadata["source"] for split in splits]
+    pages = [f"{server}/en/documentation/prod/1.0/html-single/book{i}" for i in range(BOOKS)]
+    assert sorted(set(sources), key=sources.index) == pages
+    assert sources == sorted(sources, key=pages.index)
+    assert all("Book" in split.metadata["title"] for split in splits)
+    assert any("draining it first" in split.page_content for split in splits)
+    assert set(validators) == set(pages)
+
+
+def test_unchanged_pages_are_not_split_again(server):
+    validators = {}
+    rh.generate_splits("prod", "Product", "1.0", "en-US", 768, 128, validators)
+    unchanged = set()
+    assert rh.generate_splits("prod", "Product", "1.0", "en-US", 768, 128, validators, unchanged) == []
+    assert unchanged == set(validators)
+
+
+def test_fetch_page_retries_server_errors_and_truncated_bodies(server):
+    url = f"{server}/en/documentation/prod/1.0/html-single/book1"
+    Handler.failures[urlsplit(url).path] = [503, "truncated", 429]
+    html, validators = fetch(url)
+    assert "Installing book 1" in html
+    assert validators["etag"]
+
+
+def test_fetch_page_gives_up_after_the_retries(server):
+    url = f"{server}/en/documentation/prod/1.0/html-single/book1"
+    Handler.failures[urlsplit(url).path] = [500, 502]
+    with pytest.raises(RuntimeError, match="HTTP 502"):
+        fetch(url, retries=1)
+
+
+def test_fetch_page_fails_at_once_on_client_errors(server):
+    with pytest.raises(aiohttp.ClientResponseError):
+        fetch(f"{server}/missing")
@@ -0,0 +1,128 @@
+"""Collections created against Milvus Lite, in a local .db file
+
+Run with: python -m pytest test_milvus_handler.py
+"""
+import pytest
+from langchain_core.documents import Document
+
+pytest.importorskip("milvus_lite")
+
+from pymilvus import MilvusException
+
+import milvus_handler as mh
+from classes import Collection, Source, VersionInfo
+
+DIM = 8
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = mh.MilvusHandler(str(tmp_path / "milvus.db"), "", "", "default", 32, hybrid_search=True)
+    yield handler
+    handler.client.close()
+
+
+def vector_index_type(handler, collection_name):
+    return handler.client.describe_index(collection_name, "vector")["index_type"]
+
+
+def test_default_index_is_autoindex():
+    assert mh.index_spec() == ("AUTOINDEX", {})
+    assert mh.index_spec({"index_type": "hnsw"}) == ("HNSW", {"M": 8, "efConstruction": 64})
+
+
+@pytest.mark.parametrize("index, expected", [
+    (None, "AUTOINDEX"),
+    ({"index_type": "IVF_FLAT", "params": {"nlist": 16}}, "IVF_FLAT"),
+    ({"index_type": "HNSW"}, "AUTOINDEX"),
+])
+def test_create_collection(handler, index, expected):
+    handler.create_collection("docs_4_18", DIM, index)
+    assert handler.collection_check("docs_4_18")
+    assert vector_index_type(handler, "docs_4_18") == expected
+
+    documents = [
+        Document(page_content=f"Chunk {i} about upgrades", metadata={"source": f"https://example.com/{i}", "title": "Upgrading"})
+        for i in range(3)
+    ]
+    embeddings = [[float(i + 1)] * DIM for i in range(3)]
+    handler.insert_documents("docs_4_18", documents, embeddings, "4.18")
+    rows = handler.client.query(
+        "docs_4_18", filter='version == "4.18"', output_fields=["count(*)"], consistency_level="Strong"
+    )
+    assert rows[0]["count(*)"] == 3
+
+
+def test_index_built_after_bulk_load(handler):
+    handler.create_collection("docs_4_19", DIM, {"index_type": "DISKANN"}, build_index=False)
+    handler.create_index("docs_4_19", {"index_type": "DISKANN"})
+    assert vector_index_type(handler, "docs_4_19") == "AUTOINDEX"
+
+
+class AliasClient:
+    """Milvus Lite client with aliases kept in memory, Milvus Lite has none"""
+
+    def __init__(self, client):
+        self.client = client
+        self.aliases = {}
+
+    def describe_alias(self, alias):
+        if alias not in self.aliases:
+            raise MilvusException(message=f"alias {alias} not found")
+        return {"alias": alias, "collection_name": self.aliases[alias]}
+
+    def create_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def alter_alias(self, collection_name, alias):
+        self.aliases[alias] = collection_name
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class Embeddings:
+    def __init__(self):
+        self.embedded = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [[float(len(text) % 7 + 1)] * DIM for text in texts]
+
+    def stats(self):
+        return {}
+
+
+def test_interrupted_blue_green_rebuild_is_resumed(tmp_path):
+    handler = mh.MilvusHandler(str(tmp_path / "milvus.db"), "", "", "default", 32, worklog_path=str(tmp_path / "worklog.sqlite"))
+    handler.client = AliasClient(handler.client)
+    handler.aliases_supported = handler.blue_green = True
+    handler.embeddings = Embeddings()
+    version = VersionInfo("4.18", "update", [Source("redhat_doc", language="en-US")])
+    collection = Collection("docs", "Docs", [version])
+    splits = [
+        Document(page_content=f"Chunk {i} about upgrades", metadata={"source": f"https://example.com/{i}"})
+        for i in range(6)
+    ]
+
+    def interrupted(*args, **kwargs):
+        yield from splits[:4]
+        raise ConnectionError("pod evicted")
+
+    handler.iter_splits = interrupted
+    with pytest.raises(ConnectionError):
+        handler.ingest_documentation(collection, version, batch_size=2)
+    (generation,) = handler.generations("docs_4_18")
+    assert handler.alias_target("docs_4_18") is None
+    assert handler.version_interrupted(collection, version)
+
+    handler.iter_splits = lambda *args, **kwargs: iter(splits)
+    counters = handler.ingest_documentation(collection, version, batch_size=2)
+    assert handler.generations("docs_4_18") == [generation]
+    assert handler.alias_target("docs_4_18") == generation
+    assert counters["inserted"] == 2
+    assert handler.embeddings.embedded == 6
+    rows = handler.client.query(generation, filter="", output_fields=["count(*)"], consistency_level="Strong")
+    assert rows[0]["count(*)"] == 6
+    assert not handler.version_interrupted(collection, version)
+    handler.client.close()
@@ -0,0 +1,44 @@
+"""The sparse vectors of the ingestion must match the ones of the backend queries
+
+Run with: python -m pytest test_sparse_encoder.py
+"""
+import importlib.util
+import os
+
+import sparse_encoder
+
+BACKEND_ENCODER = os.path.join(os.path.dirname(__file__), "..", "app", "backend", "sparse_encoder.py")
+
+SAMPLES = [
+    "",
+    "search_document: Run oc adm upgrade --to=4.18.3 to update the cluster.",
+    "search_query: How do I configure the ClusterVersion CRD? Error E0042: timeout",
+    "The Operator Lifecycle Manager (OLM) installs operators from catalog sources. " * 20,
+]
+
+
+def load_backend_encoder():
+    spec = importlib.util.spec_from_file_location("backend_sparse_encoder", BACKEND_ENCODER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_backend_copy_encodes_the_same():
+    backend_encoder = load_backend_encoder()
+    assert backend_encoder.DIMENSION == sparse_encoder.DIMENSION
+    for text in SAMPLES:
+        assert backend_encoder.tokenize(text) == sparse_encoder.tokenize(text)
+        assert backend_encoder.encode_document(text) == sparse_encoder.encode_document(text)
+        assert backend_encoder.encode_query(text) == sparse_encoder.encode_query(text)
+
+
+def test_cli_flags_keep_their_dashes():
+    tokens = sparse_encoder.tokenize("Run oc adm upgrade --to=4.18.3 -f - well-known E0042: timeout")
+    assert tokens == ["run", "oc", "adm", "upgrade", "--to", "4.18.3", "-f", "well-known", "e0042", "timeout"]
+
+
+def test_query_tokens_match_document_tokens():
+    document = sparse_encoder.encode_document("search_document: Run oc adm upgrade to update the cluster.")
+    query = sparse_encoder.encode_query("search_query: oc adm upgrade")
+    assert set(query) <= set(document)